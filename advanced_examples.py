@@ -2,6 +2,7 @@
 高级使用示例 - 展示更多功能
 """
 
+import asyncio
 import os
 from dotenv import load_dotenv
 from rag_demo import MedicalRAGSystem
@@ -12,14 +13,12 @@ from llama_index.core.callbacks import CallbackManager, LlamaDebugHandler
 load_dotenv()
 
 
-def example_basic_usage():
+def example_basic_usage(rag_system: MedicalRAGSystem):
     """基础使用示例"""
     print("\n" + "="*80)
     print("示例1: 基础使用")
     print("="*80 + "\n")
     
-    rag_system = MedicalRAGSystem()
-    rag_system.create_index()
     rag_system.create_query_engine()
     
     response = rag_system.query(
@@ -35,29 +34,32 @@ def example_custom_models():
     print("示例2: 使用自定义模型")
     print("="*80 + "\n")
     
-    rag_system = MedicalRAGSystem(
-        model_name="gpt-4-turbo-preview",
-        embedding_model="text-embedding-3-large"
-    )
-    
-    rag_system.create_index()
-    rag_system.create_query_engine()
-    
-    response = rag_system.query(
-        "Summarize the key findings about cabotegravir for HIV prevention."
-    )
+    # MedicalRAGSystem 会改写全局 Settings，结束后恢复，避免影响共享系统的查询
+    previous_llm, previous_embed_model = Settings.llm, Settings.embed_model
+    try:
+        rag_system = MedicalRAGSystem(
+            model_name="gpt-4-turbo-preview",
+            embedding_model="text-embedding-3-large"
+        )
+        
+        rag_system.create_index()
+        rag_system.create_query_engine()
+        
+        response = rag_system.query(
+            "Summarize the key findings about cabotegravir for HIV prevention."
+        )
+    finally:
+        Settings.llm, Settings.embed_model = previous_llm, previous_embed_model
     
     return response
 
 
-def example_rebuild_index():
+def example_rebuild_index(rag_system: MedicalRAGSystem):
     """重建索引示例"""
     print("\n" + "="*80)
     print("示例3: 重建索引")
     print("="*80 + "\n")
     
-    rag_system = MedicalRAGSystem()
-    
     # 强制重建索引（当文档有更新时）
     rag_system.create_index(force_rebuild=True)
     rag_system.create_query_engine()
@@ -65,15 +67,12 @@ def example_rebuild_index():
     print("索引已重建！")
 
 
-def example_adjust_retrieval():
+def example_adjust_retrieval(rag_system: MedicalRAGSystem):
     """调整检索参数示例"""
     print("\n" + "="*80)
     print("示例4: 调整检索参数")
     print("="*80 + "\n")
     
-    rag_system = MedicalRAGSystem()
-    rag_system.create_index()
-    
     # 返回更多相关文档以获得更全面的答案
     rag_system.create_query_engine(similarity_top_k=10)
     
@@ -84,24 +83,26 @@ def example_adjust_retrieval():
     return response
 
 
-def example_debug_mode():
+def example_debug_mode(rag_system: MedicalRAGSystem):
     """调试模式示例"""
     print("\n" + "="*80)
     print("示例5: 启用调试模式")
     print("="*80 + "\n")
     
-    # 启用调试处理器
+    # 启用调试处理器（仅对随后创建的查询引擎生效）
     llama_debug = LlamaDebugHandler(print_trace_on_end=True)
-    callback_manager = CallbackManager([llama_debug])
-    Settings.callback_manager = callback_manager
-    
-    rag_system = MedicalRAGSystem()
-    rag_system.create_index()
-    rag_system.create_query_engine(similarity_top_k=3)
-    
-    response = rag_system.query(
-        "What is the mortality rate mentioned in perioperative studies?"
-    )
+    previous_callback_manager = Settings.callback_manager
+    Settings.callback_manager = CallbackManager([llama_debug])
+    
+    try:
+        rag_system.create_query_engine(similarity_top_k=3)
+        
+        response = rag_system.query(
+            "What is the mortality rate mentioned in perioperative studies?"
+        )
+    finally:
+        # 恢复原回调，避免影响共享系统上的后续示例
+        Settings.callback_manager = previous_callback_manager
     
     # 查看事件追踪
     print("\n调试信息:")
@@ -110,15 +111,21 @@ def example_debug_mode():
     return response
 
 
-def example_batch_queries():
-    """批量查询示例"""
+def example_batch_queries(rag_system: MedicalRAGSystem):
+    """批量查询示例（并发执行）"""
+    return asyncio.run(example_batch_queries_async(rag_system))
+
+
+async def example_batch_queries_async(rag_system: MedicalRAGSystem, max_concurrency: int = 10):
+    """批量查询示例：各问题的检索与LLM调用均为I/O等待，并发发起可将总耗时压到接近单次最慢查询"""
     print("\n" + "="*80)
     print("示例6: 批量查询")
     print("="*80 + "\n")
     
-    rag_system = MedicalRAGSystem()
-    rag_system.create_index()
-    rag_system.create_query_engine()
+    # 流式输出：每个查询的 token 在生成时即被消费，同时其他查询仍在进行
+    rag_system.create_query_engine(streaming=True)
+    # 相似问题命中语义缓存时直接复用回答，跳过检索与LLM调用
+    rag_system.enable_query_cache(threshold=0.92, ttl_seconds=300)
     
     questions = [
         "What is the PROTECT trial about?",
@@ -128,27 +135,25 @@ def example_batch_queries():
         "Are there any studies about children's health?",
     ]
     
+    # aquery_batch 一次批量嵌入全部问题，并以 max_concurrency 限制同时在途的请求数
+    answers = await rag_system.aquery_batch(questions, max_concurrency=max_concurrency)
+
     results = []
-    for i, question in enumerate(questions, 1):
-        print(f"\n[查询 {i}/{len(questions)}]")
-        response = rag_system.query(question)
+    for question, answer in zip(questions, answers):
         results.append({
             "question": question,
-            "answer": str(response)
+            "answer": answer
         })
     
     return results
 
 
-def example_filter_by_metadata():
+def example_filter_by_metadata(rag_system: MedicalRAGSystem):
     """元数据过滤示例（高级）"""
     print("\n" + "="*80)
     print("示例7: 使用元数据过滤")
     print("="*80 + "\n")
     
-    rag_system = MedicalRAGSystem()
-    rag_system.create_index()
-    
     # 创建带过滤器的查询引擎
     from llama_index.core.vector_stores import MetadataFilters, MetadataFilter
     
@@ -181,28 +186,32 @@ def main():
     print("RAG系统高级使用示例")
     print("="*80)
     
+    # 各示例共用同一个系统实例：LLM/嵌入客户端与索引只初始化一次
+    rag_system = MedicalRAGSystem()
+    rag_system.create_index()
+    
     # 运行示例（可以注释掉不需要的）
     
     # 基础使用
-    # example_basic_usage()
+    # example_basic_usage(rag_system)
     
-    # 自定义模型
+    # 自定义模型（会切换模型，单独创建系统实例）
     # example_custom_models()
     
     # 重建索引
-    # example_rebuild_index()
+    # example_rebuild_index(rag_system)
     
     # 调整检索参数
-    example_adjust_retrieval()
+    example_adjust_retrieval(rag_system)
     
     # 调试模式
-    # example_debug_mode()
+    # example_debug_mode(rag_system)
     
     # 批量查询
-    # example_batch_queries()
+    # example_batch_queries(rag_system)
     
     # 元数据过滤
-    # example_filter_by_metadata()
+    # example_filter_by_metadata(rag_system)
     
     print("\n" + "="*80)
     print("示例运行完成！")
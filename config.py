@@ -2,42 +2,55 @@
 配置文件
 """
 
-# RAG系统配置
-RAG_CONFIG = {
+from dataclasses import dataclass, field
+
+
+@dataclass(frozen=True, slots=True)
+class LLMConfig:
+    """LLM模型配置"""
+    model_name: str = "gpt-4"
+    temperature: float = 0.1
+
+
+@dataclass(frozen=True, slots=True)
+class EmbeddingConfig:
+    """嵌入模型配置"""
+    model_name: str = "text-embedding-3-small"
+    # 可选：使用更强大的嵌入模型
+    # model_name: str = "text-embedding-3-large"
+
+
+@dataclass(frozen=True, slots=True)
+class QueryEngineConfig:
+    """查询引擎配置"""
+    # 返回最相似的文档数量
+    similarity_top_k: int = 5
+    # 响应模式: "compact", "tree_summarize", "simple_summarize"
+    response_mode: str = "compact"
+
+
+@dataclass(frozen=True, slots=True)
+class NodeParserConfig:
+    """Markdown分块配置"""
+    # 使用markdown标题进行分块
+    type: str = "markdown"
+
+
+@dataclass(frozen=True, slots=True)
+class RAGConfig:
+    """RAG系统配置（不可变、可哈希，可直接用作缓存键）"""
     # 数据目录
-    "data_dir": "Volume 399, Issue 10337",
-    
+    data_dir: str = "Volume 399, Issue 10337"
     # 索引持久化目录
-    "persist_dir": "./storage",
-    
-    # LLM模型配置
-    "llm": {
-        "model_name": "gpt-4",
-        "temperature": 0.1,
-    },
-    
-    # 嵌入模型配置
-    "embedding": {
-        "model_name": "text-embedding-3-small",
-        # 可选：使用更强大的嵌入模型
-        # "model_name": "text-embedding-3-large",
-    },
-    
-    # 查询引擎配置
-    "query_engine": {
-        # 返回最相似的文档数量
-        "similarity_top_k": 5,
-        
-        # 响应模式: "compact", "tree_summarize", "simple_summarize"
-        "response_mode": "compact",
-    },
-    
-    # Markdown分块配置
-    "node_parser": {
-        # 使用markdown标题进行分块
-        "type": "markdown",
-    }
-}
+    persist_dir: str = "./storage"
+    llm: LLMConfig = field(default_factory=LLMConfig)
+    embedding: EmbeddingConfig = field(default_factory=EmbeddingConfig)
+    query_engine: QueryEngineConfig = field(default_factory=QueryEngineConfig)
+    node_parser: NodeParserConfig = field(default_factory=NodeParserConfig)
+
+
+# RAG系统配置（导入时构建一次，通过属性访问，如 RAG_CONFIG.llm.model_name）
+RAG_CONFIG = RAGConfig()
 
 # 文档文件模式（首选doc.md，回退doc_*.md）
 DOC_FILE_PATTERN = "doc.md"
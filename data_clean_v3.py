@@ -1,51 +1,103 @@
 import argparse
+import hashlib
+import mmap
 import os
 import re
 import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Dict, Tuple
-
-def read_text(path: Path) -> str:
-    return path.read_text(encoding="utf-8", errors="ignore")
+from typing import Callable, List, Dict, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Linux ioctl: 让目标文件与源文件共享数据块（copy-on-write）
+FICLONE = 0x40049409
+# 单个分组内复制图片的线程数
+IMG_COPY_THREADS = 8
+
+HEADING_RE = re.compile(r"^#+\s+(.+)")
+H1_LINE_RE = re.compile(r"^[^\S\n]*#[^\S\n]+(\S[^\n]*)", re.MULTILINE)
+SUMMARY_LINE_RE = re.compile(r"^[^\S\n]*##[^\S\n]+summary[^\S\n]*$", re.MULTILINE | re.IGNORECASE)
+PAGE_NUM_RE = re.compile(r"(\d+)")
+# 与 bytes.strip() 相同的空白字节集合
+ASCII_WS = frozenset(b" \t\n\r\x0b\x0c")
+# slugify 用：删除 ASCII 范围内除字母数字、_、-、空白以外的字符
+SLUG_DROP = str.maketrans(
+    "", "", "".join(chr(c) for c in range(128) if not (chr(c).isalnum() or chr(c) in "_-" or chr(c).isspace()))
+)
 
 
 def first_heading(text: str) -> str:
     for line in text.splitlines():
-        m = re.match(r"^#+\s+(.+)", line.strip())
+        stripped = line.strip()
+        if not stripped.startswith("#"):
+            continue
+        m = HEADING_RE.match(stripped)
         if m:
             return m.group(1).strip()
     return ""
 
 
+def chunk_prefix(name: str) -> str:
+    """去掉目录名末尾的 _chunk_<数字>，不匹配时原样返回。"""
+    head, sep, tail = name.rpartition("_chunk_")
+    return head if sep and tail.isdecimal() else name
+
+
 def slugify(text: str, fallback: str) -> str:
-    text = text.strip().lower()
-    text = re.sub(r"[^\w\s-]+", "", text)
-    text = re.sub(r"[-\s]+", "-", text).strip("-")
+    text = text.strip().lower().translate(SLUG_DROP)
+    if not text.isascii():
+        # 非 ASCII 字符无法穷举进转换表，逐字符按 \w 语义过滤
+        text = "".join(ch for ch in text if ch.isalnum() or ch == "_" or ch == "-" or ch.isspace())
+    # 连续的空白与 "-" 折叠为单个 "-"，并去掉首尾 "-"
+    text = "-".join(text.replace("-", " ").split())
     return text or fallback
 
 
+def _strip_bounds(buf) -> Tuple[int, int]:
+    """返回去掉首尾 ASCII 空白后的 [start, end) 区间，不复制数据。"""
+    start, end = 0, len(buf)
+    while start < end and buf[start] in ASCII_WS:
+        start += 1
+    while end > start and buf[end - 1] in ASCII_WS:
+        end -= 1
+    return start, end
+
+
 def merge_md_files(md_files: List[Path]) -> str:
-    def dedupe_key(text: str) -> str:
-        lines = []
-        for ln in text.splitlines():
-            ln = ln.strip()
-            lines.append(ln)
-            if len(lines) >= 2:
-                break
-        return "\n".join(lines)
-
-    seen = set()
-    parts = []
+    seen: set[bytes] = set()
+    parts: List[bytes] = []
     for p in md_files:
-        content = read_text(p).strip()
-        if not content:
-            continue
-        key = dedupe_key(content)
-        if key in seen:
-            continue
-        seen.add(key)
-        parts.append(content)
-    return "\n\n".join(parts).strip()
+        # 以 mmap 只读映射页面，摘要直接在映射内存上计算，仅未重复的页面才复制出来
+        with p.open("rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start, end = _strip_bounds(mm)
+                if start >= end:
+                    continue
+                with memoryview(mm) as view, view[start:end] as content:
+                    if content[0] >= 0x80 or content[-1] >= 0x80:
+                        # 首尾为非 ASCII 字节时可能是全角空格、NBSP 等 Unicode 空白：
+                        # 解码后按 str.strip 再去一次，与逐页 strip 的结果一致；只剩空白的页面丢弃
+                        text = content.tobytes().decode("utf-8", errors="ignore").strip()
+                        if not text:
+                            continue
+                        data = text.encode("utf-8")
+                    else:
+                        data = content
+                    # 按整页内容摘要去重：仅完全相同的页面才视为重复（标题相同的不同页不再误删）
+                    key = hashlib.blake2b(data, digest_size=16).digest()
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    parts.append(data if isinstance(data, bytes) else data.tobytes())
+    # 拼接完成后统一解码一次
+    return b"\n\n".join(parts).decode("utf-8", errors="ignore").strip()
 
 
 def split_articles(full_text: str) -> List[Tuple[str, str]]:
@@ -53,67 +105,110 @@ def split_articles(full_text: str) -> List[Tuple[str, str]]:
     按一级标题切分，定位首个包含二级标题 "summary" 的文章，
     丢弃其前的内容，返回该文章及其后的所有文章。
     """
-
-    def has_summary(text: str) -> bool:
-        for ln in text.splitlines():
-            if re.match(r"^##\s+summary\s*$", ln.strip(), re.IGNORECASE):
-                return True
-        return False
-
-    sections: List[Tuple[str, str]] = []
-    title: str | None = None
-    buf: List[str] = []
-
-    for line in full_text.splitlines():
-        m = re.match(r"^#\s+(.+)", line.strip())
-        if m:
-            if title is not None and buf:
-                content = "\n".join(buf).strip()
-                sections.append((title, content))
-            title = m.group(1).strip()
-            buf = [line]
-        else:
-            if title is not None:
-                buf.append(line)
-
-    if title is not None and buf:
-        content = "\n".join(buf).strip()
-        sections.append((title, content))
+    # 统一为 \n 换行（与 splitlines 的断行规则一致），全部在 C 层完成
+    text = "\n".join(full_text.splitlines())
+    # 由正则引擎一次性定位所有一级标题，文章内容直接按相邻标题的偏移切片
+    matches = list(H1_LINE_RE.finditer(text))
+    ends = [m.start() for m in matches[1:]] + [len(text)]
 
     start_idx = None
-    for i, (_, content) in enumerate(sections):
-        if has_summary(content):
+    for i, (m, end) in enumerate(zip(matches, ends)):
+        if SUMMARY_LINE_RE.search(text, m.end(), end):
             start_idx = i
             break
 
     if start_idx is None:
         return []
 
-    return sections[start_idx:]
+    return [
+        (m.group(1).strip(), text[m.start():end].strip())
+        for m, end in zip(matches[start_idx:], ends[start_idx:])
+    ]
 
 
-def make_unique_slug(base: str, used: set[str]) -> str:
-    slug = base
-    idx = 1
-    while slug in used:
-        slug = f"{base}-{idx}"
+def make_unique_slug(base: str, used: set[str], counters: Dict[str, int]) -> str:
+    if base not in used:
+        used.add(base)
+        return base
+    # counters 记录每个 base 下一个可用的后缀，避免每次都从 -1 开始线性探测
+    idx = counters.get(base, 1)
+    while f"{base}-{idx}" in used:
         idx += 1
+    slug = f"{base}-{idx}"
+    counters[base] = idx + 1
     used.add(slug)
     return slug
 
 
+def fast_copy(src: Path, dst: Path) -> None:
+    """复制单个文件：同设备优先硬链接，其次 reflink（btrfs/xfs），最后退回 shutil.copy2。
+
+    图片只是派生产物，输出端不会修改，因此与源文件共享 inode 是安全的；
+    shutil.copy2 在 Linux 上本身已走 sendfile 内核态拷贝。
+    无论哪种方式都先写到 dst 同目录下的临时名，再 os.replace 原子替换：
+    绝不以写模式打开已存在的 dst（它可能是指向另一份输入图片的硬链接）。
+    """
+    try:
+        if dst.exists() and os.path.samefile(src, dst):
+            return
+    except OSError:
+        pass
+
+    tmp = dst.parent / f".{dst.name}.{uuid.uuid4().hex}.tmp"
+    try:
+        done = False
+        try:
+            if src.stat().st_dev == dst.parent.stat().st_dev:
+                os.link(src, tmp)
+                done = True
+        except OSError:
+            pass
+
+        if not done and fcntl is not None:
+            try:
+                # "xb"：临时名若已存在则报错，不会截断任何已有文件
+                with open(src, "rb") as fsrc, open(tmp, "xb") as fdst:
+                    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                shutil.copystat(src, tmp)
+                done = True
+            except OSError:
+                tmp.unlink(missing_ok=True)
+
+        if not done:
+            shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
 def copy_imgs(src_dirs: List[Path], dst_dir: Path) -> None:
+    copy_img_dirs([src / "imgs" for src in src_dirs], dst_dir)
+
+
+def copy_img_dirs(img_dirs: List[Path], dst_dir: Path) -> None:
     dst_dir.mkdir(parents=True, exist_ok=True)
-    for src in src_dirs:
-        imgs = src / "imgs"
+    # 先收集全部复制任务（同名文件后出现者覆盖），再批量提交到线程池，
+    # 让各文件的 open/link/copy 系统调用相互重叠
+    targets: Dict[str, Path] = {}
+    for imgs in img_dirs:
         if imgs.is_dir():
             for f in imgs.iterdir():
                 if f.is_file():
-                    target = dst_dir / f.name
-                    try:
-                        shutil.copy2(f, target)
-                    except Exception:
-                        pass
+                    targets[f.name] = f
+
+    def copy_one(item: Tuple[str, Path]) -> None:
+        name, f = item
+        try:
+            fast_copy(f, dst_dir / name)
+        except Exception:
+            pass
+
+    if len(targets) <= 1:
+        for item in targets.items():
+            copy_one(item)
+        return
+    with ThreadPoolExecutor(max_workers=min(IMG_COPY_THREADS, len(targets))) as pool:
+        list(pool.map(copy_one, targets.items()))
 
 
 def save_doc(dst_dir: Path, base_name: str, content: str) -> None:
@@ -121,64 +216,169 @@ def save_doc(dst_dir: Path, base_name: str, content: str) -> None:
     (dst_dir / base_name).write_text(content, encoding="utf-8")
 
 
-def process_chunk_sets(input_root: Path, output_root: Path):
-    """处理根目录下名字包含 _chunk_ 的文件夹：先合并成整刊，再按文章拆分。"""
+# 交由主进程落盘的结果：(输出目录, 文件名, 内容, 需复制到 输出目录/imgs 的图片目录)
+DocWrite = Tuple[Path, str, str, List[Path]]
+# (串行键, 函数, 参数)：自行写盘的任务以输出目录为键，同键任务在同一个进程内串行；
+# 键为 None 的任务只做读取与合并，返回 DocWrite（或 None），由主进程按提交顺序写盘
+Job = Tuple[Path | None, Callable[..., DocWrite | None], tuple]
+
+
+def _run_serially(jobs: List[Job]) -> List[DocWrite]:
+    writes: List[DocWrite] = []
+    for _, fn, args in jobs:
+        out = fn(*args)
+        if out is not None:
+            writes.append(out)
+    return writes
+
+
+def write_doc(write: DocWrite) -> None:
+    dst_dir, fname, content, img_dirs = write
+    copy_img_dirs(img_dirs, dst_dir / "imgs")
+    save_doc(dst_dir, fname, content)
+
+
+def run_jobs(jobs: List[Job], workers: int | None = None) -> None:
+    """合并在多进程中并行，写盘按任务提交顺序进行（同名文件后提交者覆盖，与串行结果一致）；workers=1 时全部串行。"""
+    units: List[List[Job]] = []
+    keyed: Dict[Path, List[Job]] = {}
+    for job in jobs:
+        key = job[0]
+        if key is None:
+            units.append([job])
+        elif key in keyed:
+            keyed[key].append(job)
+        else:
+            keyed[key] = [job]
+            units.append(keyed[key])
+    if workers == 1 or len(units) <= 1:
+        for unit in units:
+            for write in _run_serially(unit):
+                write_doc(write)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_serially, unit) for unit in units]
+        # 按提交顺序取回结果：前序任务（含自行写盘的分组）全部完成后才写入后续结果
+        for fut in futures:
+            for write in fut.result():
+                write_doc(write)
+
+
+def _process_one_group(prefix: str, dirs: List[Path], output_root: Path) -> None:
+    dirs.sort()
+    dst_dir = output_root / prefix
+    imgs_dst = dst_dir / "imgs"
+
+    # 每个 chunk 目录只扫描一次，同时得到页面与图片目录
+    md_files: List[Path] = []
+    img_dirs: List[Path] = []
+    for chunk_dir in dirs:
+        pages, imgs = scan_doc_folder(chunk_dir)
+        md_files.extend(p for _, p in pages)
+        if imgs is not None:
+            img_dirs.append(imgs)
+
+    # 先合并 doc_*.md 成整刊 doc.md（跨 chunk 去重，保持页序）
+    merged_issue = merge_md_files(md_files)
+    if not merged_issue:
+        return
+
+    dst_dir.mkdir(parents=True, exist_ok=True)
+    copy_img_dirs(img_dirs, imgs_dst)
+    doc_path = dst_dir / "doc.md"
+    save_doc(dst_dir, "doc.md", merged_issue)
+
+    # 再按文章切分并保存
+    articles = split_articles(merged_issue)
+    used_slugs: set[str] = set()
+    slug_counters: Dict[str, int] = {}
+    for title, content in articles:
+        base_slug = slugify(title, fallback="article")
+        slug = make_unique_slug(base_slug, used_slugs, slug_counters)
+        fname = f"{slug}.md"
+        save_doc(dst_dir, fname, content)
+
+    # 抽取完文章后删除整刊 doc.md，避免后续索引重复收录
+    try:
+        if doc_path.exists():
+            doc_path.unlink()
+    except Exception:
+        pass
+
+
+def chunk_set_jobs(input_root: Path, output_root: Path) -> List[Job]:
     # 分组：前缀 -> [chunk_dir]
     groups: Dict[str, List[Path]] = {}
     for d in input_root.iterdir():
         if d.is_dir() and "_chunk_" in d.name:
-            prefix = re.sub(r"_chunk_\d+$", "", d.name)
+            prefix = chunk_prefix(d.name)
             groups.setdefault(prefix, []).append(d)
+    return [(output_root / prefix, _process_one_group, (prefix, dirs, output_root)) for prefix, dirs in groups.items()]
 
-    for prefix, dirs in groups.items():
-        dirs.sort()
-        dst_dir = output_root / prefix
-        imgs_dst = dst_dir / "imgs"
-
-        # 先合并 doc_*.md 成整刊 doc.md（跨 chunk 去重，保持页序）
-        md_files: List[Path] = []
-        for chunk_dir in dirs:
-            md_files.extend(sorted(chunk_dir.glob("doc_*.md")))
-
-        merged_issue = merge_md_files(md_files)
-        if not merged_issue:
-            continue
 
-        dst_dir.mkdir(parents=True, exist_ok=True)
-        copy_imgs(dirs, imgs_dst)
-        doc_path = dst_dir / "doc.md"
-        save_doc(dst_dir, "doc.md", merged_issue)
-
-        # 再按文章切分并保存
-        articles = split_articles(merged_issue)
-        used_slugs: set[str] = set()
-        for title, content in articles:
-            base_slug = slugify(title, fallback="article")
-            slug = make_unique_slug(base_slug, used_slugs)
-            fname = f"{slug}.md"
-            save_doc(dst_dir, fname, content)
-
-        # 抽取完文章后删除整刊 doc.md，避免后续索引重复收录
-        try:
-            if doc_path.exists():
-                doc_path.unlink()
-        except Exception:
-            pass
+def process_chunk_sets(input_root: Path, output_root: Path, workers: int | None = None):
+    """处理根目录下名字包含 _chunk_ 的文件夹：先合并成整刊，再按文章拆分。"""
+    run_jobs(chunk_set_jobs(input_root, output_root), workers)
+
+
+def scan_doc_folder(folder: Path) -> Tuple[List[Tuple[int, Path]], Path | None]:
+    """单次 scandir 扫描 folder：返回按页码排序的 (页码, doc_*.md 路径) 列表与 imgs/ 目录（若存在）。"""
+    pages: List[Tuple[int, str, Path]] = []
+    imgs_dir: Path | None = None
+    with os.scandir(folder) as it:
+        for entry in it:
+            name = entry.name
+            if name == "imgs":
+                if entry.is_dir():
+                    imgs_dir = Path(entry.path)
+                continue
+            if not (name.startswith("doc_") and name.endswith(".md")) or not entry.is_file():
+                continue
+            m = PAGE_NUM_RE.search(name[:-3])
+            idx = int(m.group(1)) if m else 0
+            pages.append((idx, name, Path(entry.path)))
+    pages.sort(key=lambda x: (x[0], x[1]))
+    return [(idx, path) for idx, _, path in pages], imgs_dir
+
+
+def list_doc_pages(folder: Path) -> List[Tuple[int, Path]]:
+    """按页码排序返回 folder 下的 (页码, doc_*.md 路径)。"""
+    return scan_doc_folder(folder)[0]
 
 
 def collect_numbered_docs(folder: Path) -> List[Path]:
-    docs = []
-    for p in folder.glob("doc_*.md"):
-        m = re.search(r"(\d+)", p.stem)
-        idx = int(m.group(1)) if m else 0
-        docs.append((idx, p))
-    docs.sort(key=lambda x: x[0])
-    return [p for _, p in docs]
-
-
-def process_volume_folder(volume_dir: Path, output_root: Path, min_count: int = 5):
+    return [p for _, p in list_doc_pages(folder)]
+
+
+def _process_one_volume_chunk_group(key: str, dirs: List[Path], dst_dir: Path) -> DocWrite | None:
+    dirs.sort()
+    md_files: List[Path] = []
+    for d in dirs:
+        md_files.extend(sorted(d.glob("doc*.md")))
+    if not md_files:
+        return None
+    merged = merge_md_files(md_files)
+    if not merged:
+        return None
+    title = first_heading(merged) or key
+    fname = slugify(title, fallback=key) + ".md"
+    return dst_dir, fname, merged, [d / "imgs" for d in dirs]
+
+
+def _process_one_volume_sub(sub: Path, dst_dir: Path, min_count: int) -> DocWrite | None:
+    pages, imgs = scan_doc_folder(sub)
+    if len(pages) < min_count:
+        return None
+    merged = merge_md_files([p for _, p in pages])
+    if not merged:
+        return None
+    title = first_heading(merged) or sub.name
+    fname = slugify(title, fallback=sub.name) + ".md"
+    return dst_dir, fname, merged, [imgs] if imgs is not None else []
+
+
+def volume_folder_jobs(volume_dir: Path, output_root: Path, min_count: int = 5) -> List[Job]:
     dst_dir = output_root / volume_dir.name
-    imgs_dst = dst_dir / "imgs"
 
     # 先处理 chunk 子文件夹成组
     entries = [p for p in volume_dir.iterdir() if p.is_dir()]
@@ -186,65 +386,54 @@ def process_volume_folder(volume_dir: Path, output_root: Path, min_count: int =
     normal_dirs: List[Path] = []
     for d in entries:
         if "_chunk_" in d.name:
-            key = re.sub(r"_chunk_\d+$", "", d.name)
+            key = chunk_prefix(d.name)
             chunk_groups.setdefault(key, []).append(d)
         else:
             normal_dirs.append(d)
 
-    # 处理 chunk 组：视为已是整篇文章，合并去重后按一级标题命名直接保存
+    # 各任务只读取与合并，可并行；写入同一 dst_dir 由主进程按此顺序完成
+    jobs: List[Job] = []
+    # chunk 组：视为已是整篇文章，合并去重后按一级标题命名直接保存
     for key, dirs in chunk_groups.items():
-        dirs.sort()
-        md_files: List[Path] = []
-        for d in dirs:
-            md_files.extend(sorted(d.glob("doc*.md")))
-        if not md_files:
-            continue
-        merged = merge_md_files(md_files)
-        if not merged:
-            continue
-        copy_imgs(dirs, imgs_dst)
-        title = first_heading(merged) or key
-        fname = slugify(title, fallback=key) + ".md"
-        save_doc(dst_dir, fname, merged)
-
-    # 处理普通子文件夹（doc_0.md 等，页数<min_count则跳过）
+        jobs.append((None, _process_one_volume_chunk_group, (key, dirs, dst_dir)))
+    # 普通子文件夹（doc_0.md 等，页数<min_count则跳过）
     for sub in normal_dirs:
-        md_files = collect_numbered_docs(sub)
-        if len(md_files) < min_count:
-            continue
-        merged = merge_md_files(md_files)
-        if not merged:
-            continue
-        copy_imgs([sub], imgs_dst)
-        title = first_heading(merged) or sub.name
-        fname = slugify(title, fallback=sub.name) + ".md"
-        save_doc(dst_dir, fname, merged)
+        jobs.append((None, _process_one_volume_sub, (sub, dst_dir, min_count)))
+    return jobs
 
 
-def process_input(input_root: Path, output_root: Path):
-    process_chunk_sets(input_root, output_root)
+def process_volume_folder(volume_dir: Path, output_root: Path, min_count: int = 5, workers: int | None = None):
+    run_jobs(volume_folder_jobs(volume_dir, output_root, min_count=min_count), workers)
+
+
+def process_input(input_root: Path, output_root: Path, workers: int | None = None):
+    jobs = chunk_set_jobs(input_root, output_root)
 
     for d in input_root.iterdir():
         if not d.is_dir():
             continue
         if "_chunk_" in d.name:
-            # 顶层 chunk 目录已在 process_chunk_sets 里处理
+            # 顶层 chunk 目录已在 chunk_set_jobs 里处理
             continue
         # 顶层非 chunk 目录（含 Volume 与普通）统一走子目录处理逻辑
-        process_volume_folder(d, output_root, min_count=5)
+        jobs.extend(volume_folder_jobs(d, output_root, min_count=5))
+
+    # 所有分组共用一个进程池
+    run_jobs(jobs, workers)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Clean and merge markdown data.")
     parser.add_argument("--input_root", default="input", help="原始数据根目录")
     parser.add_argument("--output_root", default="output", help="输出根目录")
+    parser.add_argument("--workers", type=int, default=None, help="并行进程数（默认 CPU 核数，1 为串行）")
     args = parser.parse_args()
 
     input_root = Path(args.input_root)
     output_root = Path(args.output_root)
     output_root.mkdir(parents=True, exist_ok=True)
 
-    process_input(input_root, output_root)
+    process_input(input_root, output_root, workers=args.workers)
     print(f"Done. Output at {output_root}")
 
 
@@ -0,0 +1,70 @@
+"""
+检索结果的 Markdown 格式化函数（Gradio 界面每次请求都会调用）。
+
+本模块只依赖标准库且注解完整，可选地用 mypyc 编译为 C 扩展：
+    mypyc formatters.py
+编译产物（formatters.*.so）与源文件同目录时会被优先导入，调用方无需改动。
+"""
+
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from rag_demo import RetrievalHit, TextNode
+
+
+def first_meta(meta: Dict[str, Any], *keys: str, default: str = "") -> str:
+    """按顺序返回第一个非空的元数据字段。"""
+    for key in keys:
+        value = meta.get(key)
+        if value:
+            return str(value)
+    return default
+
+
+def parent_id_of(node: "TextNode") -> str:
+    meta: Dict[str, Any] = node.metadata or {}
+    return str(meta.get("parent_node_id") or node.node_id)
+
+
+def snippet(text: Optional[str], limit: int) -> str:
+    """截断到 limit 个字符；仅在首尾有空白时才 strip，避免多余的拷贝。"""
+    if not text:
+        return ""
+    if text[0].isspace() or text[-1].isspace():
+        text = text.strip()
+    return text if len(text) <= limit else f"{text[:limit]}..."
+
+
+def format_children(children: List["RetrievalHit"], limit_chars: int = 400) -> str:
+    if not children:
+        return "(no hits)"
+    lines: List[str] = [""] * len(children)
+    idx: int
+    for idx, hit in enumerate(children, start=1):
+        node = hit.node
+        meta: Dict[str, Any] = node.metadata or {}
+        parent_id: str = parent_id_of(node)
+        header: str = first_meta(meta, "section_header")
+        src: str = first_meta(meta, "file_name", "filename")
+        doc_title: str = first_meta(meta, "doc_title", default="?")
+        doc_doi: str = first_meta(meta, "doc_doi", default="?")
+        # doc_authors_str 在检索阶段由 _enrich_node_metadata 预先拼接
+        authors_str: str = first_meta(meta, "doc_authors_str", default="?")
+        # RetrievalHit 构造时已保证三个分数均为 float
+        label: str = (
+            f"**#{idx}** score={hit.score:.4f} (vec={hit.vec_score:.4f}, kw={hit.kw_score:.4f})"
+            f" | title={doc_title} | doi={doc_doi} | authors={authors_str}"
+            f" | parent={parent_id} | header={header} | source={src}"
+        )
+        lines[idx - 1] = f"{label}\n\n{snippet(node.text, limit_chars)}"
+    return "\n\n---\n\n".join(lines)
+
+
+def format_parents(parent_map: Dict[str, str], limit_chars: int = 1200) -> str:
+    lines: List[str] = []
+    idx: int
+    pid: str
+    ptext: str
+    for idx, (pid, ptext) in enumerate(parent_map.items(), start=1):
+        lines.append(f"**Parent {idx}** ({pid})\n\n{snippet(ptext, limit_chars)}")
+    return "\n\n---\n\n".join(lines) if lines else "(no parents)"
@@ -3,117 +3,138 @@ Gradio UI for MedicalRAGSystem: ask a question, show retrieved child chunks,
 corresponding parent blocks, and the final LLM answer.
 """
 
+import asyncio
+import hashlib
 import os
-import json
-from typing import List, Dict
+import re
+import threading
+import time
+from collections import OrderedDict
+from html import escape
+from pathlib import Path
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 
 import gradio as gr
-from rag_demo import MedicalRAGSystem, TextNode, Settings, RetrievalHit
+
+from formatters import first_meta, format_children, format_parents, parent_id_of
+from rag_demo import MedicalRAGSystem, ParentTextStore, Settings, RetrievalHit
 
 # Optional: set defaults via env
 DATA_DIR = os.getenv("RAG_DATA_DIR", "output")
 PERSIST_DIR = os.getenv("RAG_PERSIST_DIR", "./storage")
 CHUNK_CHARS = int(os.getenv("PARAGRAPH_CHUNK_CHARS", "1200"))
 DEFAULT_TOP_K = int(os.getenv("RAG_TOP_K", "5"))
+LLM_CONCURRENCY = int(os.getenv("RAG_LLM_CONCURRENCY", "8"))
+ANSWER_CACHE_SIZE = int(os.getenv("RAG_ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("RAG_ANSWER_CACHE_TTL", "3600"))
+QUEUE_MAX_SIZE = int(os.getenv("RAG_QUEUE_MAX_SIZE", "64"))
+CSS_PATH = Path(__file__).parent / "static" / "app.css"
+WARMUP = os.getenv("RAG_WARMUP", "1") == "1"
+STREAM_YIELD_EVERY = int(os.getenv("RAG_STREAM_YIELD_EVERY", "8"))
+
+# 回答中的 [P#] 引用标记，包装为可点击的标签
+REF_RE = re.compile(r"\[(P\d+)\]")
+REF_SUB = r'<span class="ref-tag" data-ref="\1">[\1]</span>'
+
+# 限制同时在途的 LLM 请求数，避免触发服务商限流
+llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+# (question, top_k, disable_kw) -> (写入时间, 四个输出)；TTL + LRU 淘汰
+AnswerOutputs = Tuple[str, str, str, str]
+_answer_cache: "OrderedDict[str, Tuple[float, AnswerOutputs]]" = OrderedDict()
+_answer_cache_lock = threading.Lock()
+
+
+def _answer_cache_key(question: str, top_k: int, disable_kw: bool) -> str:
+    raw = f"{question}\x1f{top_k}\x1f{disable_kw}".encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def _answer_cache_get(key: str) -> Optional[AnswerOutputs]:
+    with _answer_cache_lock:
+        entry = _answer_cache.get(key)
+        if entry is None:
+            return None
+        ts, outputs = entry
+        if time.monotonic() - ts > ANSWER_CACHE_TTL:
+            del _answer_cache[key]
+            return None
+        _answer_cache.move_to_end(key)
+        return outputs
+
+
+def _answer_cache_put(key: str, outputs: AnswerOutputs) -> None:
+    with _answer_cache_lock:
+        _answer_cache[key] = (time.monotonic(), outputs)
+        _answer_cache.move_to_end(key)
+        while len(_answer_cache) > ANSWER_CACHE_SIZE:
+            _answer_cache.popitem(last=False)
+
+
+def retrieve_hits(question: str, top_k: int, disable_kw: bool) -> List[RetrievalHit]:
+    return rag_system.dual_retrieve_hits(
+        question,
+        top_k_vector=top_k,
+        top_k_keyword=0 if disable_kw else top_k,
+        merge_top_k=top_k,
+        beta=0.0 if disable_kw else 0.15,
+        use_keyword=not disable_kw,
+        # 不预先嵌入：向量检索内部嵌入问题的同时 BM25 在线程池中并行；
+        # Settings.embed_model（CachedOpenAIEmbedding）自带查询向量缓存，相同问题不会重复请求
+    )
 
 
 def ensure_parent_map(rag: MedicalRAGSystem) -> None:
-    """Rebuild parent_text_map if missing (cheap: no embeddings)."""
+    """Load parent_text_map from storage, rebuilding from documents only on a miss."""
+    if rag.parent_text_map:
+        return
+    rag.parent_text_map = rag._load_parent_map()
     if rag.parent_text_map:
         return
     docs = rag.load_documents()
     parents = rag._build_parent_nodes(docs)
-    rag.parent_text_map = {node.node_id: node.text for node in parents}
-
-
-def format_children(children: List[RetrievalHit], limit_chars: int = 400) -> str:
-    lines: List[str] = []
-    for idx, hit in enumerate(children, start=1):
-        node: TextNode = hit.node
-        meta: Dict = node.metadata or {}
-        score = hit.score if hit.score is not None else 0.0
-        vec_score = getattr(hit, "vec_score", 0.0) or 0.0
-        kw_score = getattr(hit, "kw_score", 0.0) or 0.0
-        parent_id = meta.get("parent_node_id") or node.node_id
-        header = meta.get("section_header") or ""
-        src = meta.get("file_name") or meta.get("filename") or ""
-        doc_title = meta.get("doc_title") or ""
-        doc_doi = meta.get("doc_doi") or ""
-        doc_authors = meta.get("doc_authors") or []
-        authors_str = ", ".join(doc_authors) if doc_authors else ""
-        snippet = (node.text or "").strip()
-        label_parts = [
-            f"**#{idx}** score={score:.4f} (vec={vec_score:.4f}, kw={kw_score:.4f})",
-            f"title={doc_title}" if doc_title else "title=?",
-            f"doi={doc_doi}" if doc_doi else "doi=?",
-            f"authors={authors_str}" if authors_str else "authors=?",
-            f"parent={parent_id}",
-            f"header={header}",
-            f"source={src}",
-        ]
-        label = " | ".join(label_parts)
-        body = snippet if len(snippet) <= limit_chars else snippet[:limit_chars] + "..."
-        lines.append(f"{label}\n\n{body}")
-    return "\n\n---\n\n".join(lines) if lines else "(no hits)"
-
-
-def format_parents(parent_map: Dict[str, str], limit_chars: int = 1200) -> str:
-    lines: List[str] = []
-    for idx, (pid, ptext) in enumerate(parent_map.items(), start=1):
-        text = (ptext or "").strip()
-        body = text if len(text) <= limit_chars else text[:limit_chars] + "..."
-        lines.append(f"**Parent {idx}** ({pid})\n\n{body}")
-    return "\n\n---\n\n".join(lines) if lines else "(no parents)"
-
-
-def answer_question(question: str, top_k: int, disable_kw: bool) -> tuple[str, str, str, str]:
+    rag.parent_text_map = ParentTextStore((node.node_id, node.text) for node in parents)
+
+
+async def answer_question(question: str, top_k: int, disable_kw: bool) -> AsyncIterator[AnswerOutputs]:
+    """流式生成四个输出；检索结果先行展示，回答随 token 到达逐步刷新。"""
     question = (question or "").strip()
     if not question:
-        return "请先输入问题。", "", ""
+        yield "请先输入问题。", "", "", ""
+        return
 
-    use_kw = not disable_kw
-    kw_topk = 0 if disable_kw else top_k
-    beta = 0.0 if disable_kw else 0.15
+    cache_key = _answer_cache_key(question, top_k, disable_kw)
+    cached = _answer_cache_get(cache_key)
+    if cached is not None:
+        yield cached
+        return
 
     try:
-        children_hits = rag_system.dual_retrieve_hits(
-            question,
-            top_k_vector=top_k,
-            top_k_keyword=kw_topk,
-            merge_top_k=top_k,
-            beta=beta,
-            use_keyword=use_kw,
-        )
+        # 检索为同步调用，放到工作线程执行，避免阻塞事件循环中的其他请求
+        children_hits = await asyncio.to_thread(retrieve_hits, question, top_k, disable_kw)
     except Exception as exc:  # noqa: BLE001
-        return f"检索出错: {exc}", "", "", ""
+        yield f"检索出错: {exc}", "", "", ""
+        return
 
-    # Build parent map
-    parent_map: Dict[str, str] = {}
+    # Build parent map: 按父块去重并保持命中顺序，首次出现的命中提供父块原文与元数据
+    first_hits: Dict[str, RetrievalHit] = {}
     for hit in children_hits:
-        node: TextNode = hit.node
-        meta: Dict = node.metadata or {}
-        parent_id = meta.get("parent_node_id") or node.node_id
-        if parent_id not in parent_map:
-            parent_map[parent_id] = rag_system.parent_text_map.get(parent_id, node.text or "")
+        first_hits.setdefault(parent_id_of(hit.node), hit)
+    parent_map: Dict[str, str] = {pid: hit.parent_text for pid, hit in first_hits.items()}
 
     # Build reference labels for parents
     parent_infos = []
-    for idx, (pid, ptext) in enumerate(parent_map.items(), start=1):
+    for idx, (pid, hit) in enumerate(first_hits.items(), start=1):
         ref_label = f"P{idx}"
-        # pick any hit whose parent matches
-        meta = {}
-        for h in children_hits:
-            m = h.node.metadata or {}
-            if (m.get("parent_node_id") or h.node.node_id) == pid:
-                meta = m
-                break
+        meta = hit.node.metadata or {}
+        ptext = hit.parent_text
         parent_infos.append(
             {
                 "label": ref_label,
                 "parent_id": pid,
-                "title": meta.get("doc_title") or meta.get("section_header") or "",
-                "doi": meta.get("doc_doi") or "",
-                "authors": ", ".join(meta.get("doc_authors") or []),
+                "title": first_meta(meta, "doc_title", "section_header"),
+                "doi": first_meta(meta, "doc_doi"),
+                "authors": first_meta(meta, "doc_authors_str"),
                 "text": (ptext or "").strip(),
             }
         )
@@ -133,37 +154,78 @@ def answer_question(question: str, top_k: int, disable_kw: bool) -> tuple[str, s
         f"上下文:\n{context}\n\n问题: {question}\n\n回答:"
     )
 
-    try:
-        llm_resp = Settings.llm.complete(prompt)
-        answer_text = llm_resp.text if hasattr(llm_resp, "text") else str(llm_resp)
-    except Exception as exc:  # noqa: BLE001
-        answer_text = f"LLM 调用失败: {exc}"
-
-    # Wrap reference markers for front-end click handling
-    import re
-
-    def wrap_refs(text: str) -> str:
-        return re.sub(r"\[(P\d+)\]", r'<span class="ref-tag" data-ref="\1">[\1]</span>', text)
-
-    answer_marked = wrap_refs(answer_text)
-
-    # Build source table HTML + JS for click-to-view details
-    rows = []
-    for p in parent_infos:
-        rows.append(
-            f"<tr><td>{p['label']}</td><td>{p['title']}</td><td>{p['doi']}</td><td>{p['authors']}</td></tr>"
-        )
-    ref_meta = json.dumps(parent_infos, ensure_ascii=False)
+    # Build source table HTML; 引用详情放在行的 data-* 属性中，由页面级脚本读取
+    rows = [
+        f"<tr data-ref='{p['label']}' data-title='{escape(p['title'])}' "
+        f"data-doi='{escape(p['doi'])}' data-authors='{escape(p['authors'])}'>"
+        f"<td>{p['label']}</td><td>{escape(p['title'])}</td>"
+        f"<td>{escape(p['doi'])}</td><td>{escape(p['authors'])}</td></tr>"
+        for p in parent_infos
+    ]
     source_table = (
-        "<table class='src-table'><thead><tr><th>引用</th><th>标题</th><th>DOI</th><th>作者</th></tr></thead><tbody>"
-        + "".join(rows)
-        + "</tbody></table>"
-        + f"<script>window.REF_META={ref_meta};function renderRefDetail(label){{const box=document.getElementById('ref-detail-box');if(!box)return;const m=(window.REF_META||[]).find(x=>x.label===label);if(!m){{box.innerHTML='未找到引用 '+label;return;}}box.innerHTML=`<b>${{m.label}}</b> · ${{m.title||'无标题'}}<br>DOI: ${{m.doi||'—'}}<br>作者: ${{m.authors||'—'}}`;}}document.addEventListener('click',e=>{{if(e.target.classList.contains('ref-tag')){{const lb=e.target.getAttribute('data-ref');renderRefDetail(lb);}}}});</script>"
+        "<table class='src-table'><thead><tr><th>引用</th><th>标题</th><th>DOI</th><th>作者</th></tr></thead>"
+        f"<tbody>{''.join(rows)}</tbody></table>"
     )
 
     children_md = format_children(children_hits)
     parents_md = format_parents(parent_map)
-    return answer_marked, children_md, parents_md, source_table
+    # 子块/父块/来源表不依赖回答，先推送给前端
+    yield "", children_md, parents_md, source_table
+
+    answer_text = ""
+    llm_ok = True
+    try:
+        async with llm_semaphore:
+            stream = await Settings.llm.astream_complete(prompt)
+            pending = 0
+            async for chunk in stream:
+                answer_text += chunk.delta or ""
+                pending += 1
+                # 每攒 N 个 token 刷新一次，减少前端推送次数
+                if pending >= STREAM_YIELD_EVERY:
+                    pending = 0
+                    yield REF_RE.sub(REF_SUB, answer_text), children_md, parents_md, source_table
+    except Exception as exc:  # noqa: BLE001
+        answer_text = f"{answer_text}\n\nLLM 调用失败: {exc}" if answer_text else f"LLM 调用失败: {exc}"
+        llm_ok = False
+
+    # Wrap reference markers for front-end click handling
+    outputs = (REF_RE.sub(REF_SUB, answer_text), children_md, parents_md, source_table)
+    # 只缓存成功的回答，LLM 失败时下次点击仍会重试
+    if llm_ok:
+        _answer_cache_put(cache_key, outputs)
+    yield outputs
+
+
+# 点击 [P#] 显示引用详情；gr.HTML 中的 <script> 不会执行，因此在页面 head 中只注册一次
+REF_HANDLER_JS = """
+<script>
+if (!window.__refHandlerInstalled) {
+  window.__refHandlerInstalled = true;
+  document.addEventListener('click', (e) => {
+    const tag = e.target.closest ? e.target.closest('.ref-tag') : null;
+    if (!tag) return;
+    const box = document.getElementById('ref-detail-box');
+    if (!box) return;
+    const label = tag.getAttribute('data-ref');
+    const row = document.querySelector(`.src-table tr[data-ref="${label}"]`);
+    box.className = '';
+    box.replaceChildren();
+    if (!row) {
+      box.textContent = '未找到引用 ' + label;
+      return;
+    }
+    const head = document.createElement('b');
+    head.textContent = label;
+    box.append(
+      head, ' · ' + (row.dataset.title || '无标题'), document.createElement('br'),
+      'DOI: ' + (row.dataset.doi || '—'), document.createElement('br'),
+      '作者: ' + (row.dataset.authors || '—'),
+    );
+  });
+}
+</script>
+"""
 
 
 # Initialize system
@@ -182,6 +244,20 @@ except Exception:
 
 ensure_parent_map(rag_system)
 
+
+def warm_up() -> None:
+    """启动时预先建立到 LLM/embedding 服务的连接，首个用户请求无需再付握手延迟。"""
+    try:
+        Settings.embed_model.get_query_embedding("ping")
+        Settings.llm.complete("ping")
+    except Exception as exc:  # noqa: BLE001
+        print(f"预热失败（不影响使用）: {exc}")
+
+
+# 后台预热，不阻塞界面启动；CI 等场景可设置 RAG_WARMUP=0 关闭
+if WARMUP:
+    threading.Thread(target=warm_up, name="rag-warmup", daemon=True).start()
+
 # 创建现代蓝色科技主题（强制亮色模式）
 modern_blue_theme = gr.themes.Soft(
     primary_hue=gr.themes.colors.blue,
@@ -205,6 +281,7 @@ modern_blue_theme = gr.themes.Soft(
 with gr.Blocks(
     title="Medical RAG QA - 医学文献智能问答系统",
     theme=modern_blue_theme,
+    head=REF_HANDLER_JS,
 ) as demo:
     gr.HTML("""
         <div style="text-align: center; padding: 20px 0; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); border-radius: 10px; margin-bottom: 20px;">
@@ -268,6 +345,10 @@ with gr.Blocks(
                     gr.Markdown("### 📚 引用来源", elem_classes=["section-title"])
                     gr.Markdown("_点击回答中的 [P#] 标记查看详细信息_", elem_classes=["hint-text"])
                     source_table = gr.HTML(elem_classes=["source-box", "content-box"])
+                    gr.HTML(
+                        "<div id='ref-detail-box' class='ref-placeholder'>点击回答中的 [P#] 标记查看引用详情</div>",
+                        elem_classes=["detail-box", "content-box"],
+                    )
             
             # 下排：检索详情
             gr.Markdown("### 🔎 检索详情", elem_classes=["section-title"])
@@ -284,380 +365,17 @@ with gr.Blocks(
         answer_question,
         inputs=[question_box, topk_slider, disable_kw],
         outputs=[answer_out, children_out, parents_out, source_table],
+        # 与 llm_semaphore 共用同一并发预算
+        concurrency_limit=LLM_CONCURRENCY,
+        concurrency_id="llm",
+        show_api=False,
     )
 
 if __name__ == "__main__":
-    css_rules = """
-    /* 全局样式 - 强制亮色模式 */
-    :root {
-        color-scheme: light !important;
-    }
-    
-    body, .gradio-container {
-        background: linear-gradient(135deg, #f5f7fa 0%, #e8f0fe 100%) !important;
-        font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif !important;
-        color: #1e293b !important;
-    }
-    
-    /* 确保所有文本默认可见 */
-    * {
-        color: #1e293b !important;
-    }
-    
-    /* 标签和提示文字 */
-    label, .label, .gr-block-label, .gr-form-label,
-    .gr-info, .info, span, p, div {
-        color: #1e293b !important;
-    }
-    
-    /* 侧边栏样式 */
-    .sidebar {
-        background: white !important;
-        border-radius: 16px;
-        padding: 24px;
-        box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1), 0 2px 4px -1px rgba(0, 0, 0, 0.06);
-        border: 1px solid #e0e7ff;
-    }
-    
-    .sidebar label,
-    .sidebar .gr-block-label,
-    .sidebar p,
-    .sidebar span {
-        color: #1e293b !important;
-    }
-    
-    .sidebar-title {
-        color: #1e40af;
-        font-weight: 700;
-        font-size: 1.25em;
-        margin-bottom: 20px;
-        padding-bottom: 12px;
-        border-bottom: 2px solid #3b82f6;
-    }
-    
-    .question-input textarea {
-        border: 2px solid #bfdbfe !important;
-        border-radius: 12px !important;
-        transition: all 0.3s ease;
-        color: #1e293b !important;
-        background: #eff6ff !important;
-    }
-    
-    .question-input textarea:focus {
-        border-color: #3b82f6 !important;
-        box-shadow: 0 0 0 3px rgba(59, 130, 246, 0.1) !important;
-        background: #dbeafe !important;
-    }
-    
-    /* 输入框下的提示文字 */
-    .question-input .gr-info,
-    .question-input + .gr-info,
-    .gr-form .gr-info {
-        color: #64748b !important;
-    }
-    
-    .search-button {
-        margin-top: 20px;
-        border-radius: 12px !important;
-        font-weight: 600 !important;
-        font-size: 1.1em !important;
-        padding: 12px 24px !important;
-        box-shadow: 0 4px 6px -1px rgba(59, 130, 246, 0.4) !important;
-        transition: all 0.3s ease !important;
-    }
-    
-    .search-button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 6px 12px -1px rgba(59, 130, 246, 0.5) !important;
-    }
-    
-    .tips-box {
-        background: #eff6ff !important;
-        padding: 16px;
-        border-radius: 12px;
-        margin-top: 20px;
-        border-left: 4px solid #3b82f6;
-        font-size: 0.9em;
-        color: #1e40af;
-    }
-    
-    /* 主内容区样式 */
-    .main-content {
-        padding-left: 20px;
-    }
-    
-    .section-title {
-        color: #1e40af;
-        font-weight: 700;
-        font-size: 1.4em;
-        margin-bottom: 16px;
-        padding-left: 8px;
-        border-left: 4px solid #3b82f6;
-    }
-    
-    .subsection-title {
-        color: #3b82f6;
-        font-weight: 600;
-        font-size: 1.1em;
-        margin-bottom: 12px;
-    }
-    
-    .hint-text {
-        color: #64748b;
-        font-size: 0.9em;
-        font-style: italic;
-        margin-bottom: 12px;
-    }
-    
-    .content-box {
-        background: white !important;
-        border: 2px solid #bfdbfe;
-        border-radius: 12px;
-        padding: 20px;
-        box-shadow: 0 2px 4px rgba(0, 0, 0, 0.05);
-        min-height: 400px;
-        max-height: 600px;
-        overflow-y: auto;
-        transition: border-color 0.3s ease;
-    }
-    
-    .answer-box.content-box {
-        min-height: 500px;
-        max-height: 700px;
-    }
-    
-    /* 内容框文本样式 - 精确控制 */
-    .content-box .markdown-body,
-    .content-box .prose,
-    .content-box p,
-    .content-box div:not(.ref-tag),
-    .content-box span:not(.ref-tag),
-    .content-box h1,
-    .content-box h2,
-    .content-box h3,
-    .content-box h4,
-    .content-box h5,
-    .content-box h6,
-    .content-box li,
-    .content-box strong,
-    .content-box b,
-    .content-box em,
-    .content-box i {
-        color: #1e293b !important;
-        background: transparent !important;
-    }
-    
-    .content-box:hover {
-        border-color: #93c5fd;
-    }
-    
-    .answer-box {
-        font-size: 1.05em;
-        line-height: 1.8;
-    }
-    
-    .answer-box p,
-    .answer-box div:not(.ref-tag),
-    .answer-box span:not(.ref-tag) {
-        color: #1e293b !important;
-    }
-    
-    .source-box {
-        max-height: 300px;
-    }
-    
-    .source-box p,
-    .source-box div {
-        color: #1e293b !important;
-    }
-    
-    .detail-box {
-        max-height: 180px;
-        margin-top: 12px;
-    }
-    
-    .detail-box p,
-    .detail-box div {
-        color: #1e293b !important;
-    }
-    
-    .ref-placeholder {
-        color: #64748b !important;
-        text-align: center;
-        padding: 40px 20px;
-        font-size: 0.95em;
-        line-height: 1.6;
-    }
-    
-    .children-box,
-    .parents-box {
-        max-height: 400px;
-        font-size: 0.95em;
-    }
-    
-    .children-box p,
-    .children-box div,
-    .children-box span,
-    .children-box strong,
-    .children-box b,
-    .children-box em,
-    .children-box code,
-    .parents-box p,
-    .parents-box div,
-    .parents-box span,
-    .parents-box strong,
-    .parents-box b,
-    .parents-box em,
-    .parents-box code {
-        color: #1e293b !important;
-    }
-    
-    /* 引用标签样式 */
-    .ref-tag {
-        color: #2563eb;
-        cursor: pointer;
-        font-weight: 700;
-        padding: 2px 6px;
-        border-radius: 4px;
-        background: #dbeafe;
-        transition: all 0.2s ease;
-        display: inline-block;
-        margin: 0 2px;
-    }
-    
-    .ref-tag:hover {
-        background: #3b82f6;
-        color: white;
-        transform: translateY(-1px);
-        box-shadow: 0 2px 4px rgba(37, 99, 235, 0.3);
-    }
-    
-    /* 引用表格样式 */
-    .src-table {
-        width: 100%;
-        border-collapse: collapse;
-        font-size: 0.9em;
-        background: white !important;
-        border-radius: 8px;
-        overflow: hidden;
-    }
-    
-    .src-table th, .src-table td {
-        border: 1px solid #e0e7ff;
-        padding: 10px 12px;
-        text-align: left;
-        color: #1e293b !important;
-        background: white !important;
-    }
-    
-    .src-table th {
-        background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%) !important;
-        color: white !important;
-        font-weight: 600;
-        text-transform: uppercase;
-        font-size: 0.85em;
-        letter-spacing: 0.5px;
-    }
-    
-    .src-table tbody tr {
-        transition: background-color 0.2s ease;
-        background: white !important;
-    }
-    
-    .src-table tbody tr td {
-        color: #1e293b !important;
-        background: white !important;
-    }
-    
-    .src-table tbody tr:nth-child(even) {
-        background: #f8fafc !important;
-    }
-    
-    .src-table tbody tr:nth-child(even) td {
-        background: #f8fafc !important;
-        color: #1e293b !important;
-    }
-    
-    .src-table tbody tr:hover {
-        background: #eff6ff !important;
-    }
-    
-    .src-table tbody tr:hover td {
-        background: #eff6ff !important;
-        color: #1e293b !important;
-    }
-    
-    /* 滚动条美化 */
-    .content-box::-webkit-scrollbar {
-        width: 8px;
-    }
-    
-    .content-box::-webkit-scrollbar-track {
-        background: #f1f5f9;
-        border-radius: 4px;
-    }
-    
-    .content-box::-webkit-scrollbar-thumb {
-        background: #cbd5e1;
-        border-radius: 4px;
-    }
-    
-    .content-box::-webkit-scrollbar-thumb:hover {
-        background: #94a3b8;
-    }
-    
-    /* 输入框和滑块美化 */
-    .gr-box input, .gr-box textarea, .gr-box select {
-        border-radius: 8px !important;
-        border: 2px solid #e0e7ff !important;
-        background: white !important;
-        color: #1e293b !important;
-    }
-    
-    .gr-box input:focus, .gr-box textarea:focus {
-        border-color: #3b82f6 !important;
-        box-shadow: 0 0 0 3px rgba(59, 130, 246, 0.1) !important;
-        background: white !important;
-    }
-    
-    /* 确保所有输入元素文字可见 */
-    input, textarea, select, .gr-text-input, .gr-textbox {
-        color: #1e293b !important;
-        background: white !important;
-    }
-    
-    /* Checkbox 样式 */
-    input[type="checkbox"] {
-        accent-color: #3b82f6 !important;
-        transform: scale(1.3);
-        cursor: pointer;
-        width: 18px;
-        height: 18px;
-    }
-    
-    input[type="checkbox"]:checked {
-        background-color: #3b82f6 !important;
-        border-color: #3b82f6 !important;
-    }
-    
-    .gr-checkbox {
-        accent-color: #3b82f6 !important;
-    }
-    
-    /* 响应式调整 */
-    @media (max-width: 1024px) {
-        .sidebar {
-            margin-bottom: 20px;
-        }
-        
-        .main-content {
-            padding-left: 0;
-        }
-    }
-    """
-    
+    css_rules = CSS_PATH.read_text(encoding="utf-8")
     port = int(os.getenv("GRADIO_SERVER_PORT", os.getenv("PORT", "7860")))
     host = os.getenv("GRADIO_SERVER_NAME", "0.0.0.0")
+    demo.queue(default_concurrency_limit=LLM_CONCURRENCY, max_size=QUEUE_MAX_SIZE)
     demo.launch(
         server_name=host,
         server_port=port,
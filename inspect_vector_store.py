@@ -1,11 +1,31 @@
 """Inspect vector store entries and print their text chunks."""
 
 import json
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from typing import Any, Dict, Iterable, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional speedup, fall back to stdlib json
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # optional, enables streaming large vector stores
+    ijson = None
 
 VECTOR_STORE_PATH = Path("storage/default__vector_store.json")
 DOCSTORE_PATH = Path("storage/docstore.json")
+# Stores larger than this are streamed (when ijson is installed) instead of loaded whole
+STREAM_THRESHOLD_BYTES = 64 * 1024 * 1024
+
+
+def _loads(raw: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
 
 def extract_entries(data: Dict[str, Any]):
@@ -21,12 +41,17 @@ def extract_entries(data: Dict[str, Any]):
     return {}
 
 
+@lru_cache(maxsize=1)
+def _load_vector_store() -> Dict[str, Any]:
+    return _loads(VECTOR_STORE_PATH.read_bytes())
+
+
+@lru_cache(maxsize=1)
 def load_docstore() -> Dict[str, Any]:
     if not DOCSTORE_PATH.exists():
         return {}
 
-    with DOCSTORE_PATH.open("r", encoding="utf-8") as f:
-        raw = json.load(f)
+    raw = _loads(DOCSTORE_PATH.read_bytes())
 
     candidates = (
         raw.get("docstore/data"),
@@ -48,8 +73,8 @@ def load_docstore() -> Dict[str, Any]:
 
 def iter_entry_pairs(entries: Any) -> Iterable[Tuple[str, Any]]:
     if isinstance(entries, dict):
-        for key, value in entries.items():
-            yield str(key), value
+        # JSON object keys are already strings
+        yield from entries.items()
         return
 
     if isinstance(entries, list):
@@ -131,13 +156,75 @@ def normalize_metadata(metadata: Any) -> Any:
     return normalized
 
 
+def _stream_first_entries(limit: int) -> Optional[Tuple[List[Tuple[str, Any]], Dict[str, Any]]]:
+    """Stream the first `limit` embedding_dict entries and their metadata.
+
+    Returns None when the layout is not a (possibly wrapped) embedding_dict,
+    so the caller can fall back to loading the whole file.
+    """
+    with VECTOR_STORE_PATH.open("rb") as f:
+        first_key = next(
+            (value for prefix, event, value in ijson.parse(f) if prefix == "" and event == "map_key"),
+            None,
+        )
+    if first_key == "simple_vector_store_data":
+        entries_path = "simple_vector_store_data.embedding_dict"
+    elif first_key in ("embedding_dict", "text_id_to_ref_doc_id", "metadata_dict"):
+        entries_path = "embedding_dict"
+    else:
+        return None
+
+    with VECTOR_STORE_PATH.open("rb") as f:
+        pairs = list(islice(ijson.kvitems(f, entries_path), limit))
+    if not pairs:
+        return None
+
+    wanted = {key for key, _ in pairs}
+    metadata_dict: Dict[str, Any] = {}
+    with VECTOR_STORE_PATH.open("rb") as f:
+        for key, value in ijson.kvitems(f, "metadata_dict"):
+            if key in wanted:
+                metadata_dict[key] = value
+                if len(metadata_dict) == len(wanted):
+                    break
+    return pairs, metadata_dict
+
+
+def print_entry(idx: int, denominator: int, key: str, text: Any, metadata: Any) -> None:
+    print("-" * 80)
+    print(f"Entry {idx}/{denominator} | Vector ID: {key}")
+    if text:
+        snippet = text.strip()
+        print(f"Text (first 400 chars):\n{snippet[:400]}\n")
+        if len(snippet) > 400:
+            print("...")
+    else:
+        print("[No text payload found]")
+    if metadata:
+        print("Metadata:")
+        for m_key, m_value in metadata.items():
+            print(f"  {m_key}: {m_value}")
+    else:
+        print("[No metadata]")
+
+
 def main(limit: int = 10) -> None:
     if not VECTOR_STORE_PATH.exists():
         print(f"Vector store file not found: {VECTOR_STORE_PATH}")
         return
 
-    with VECTOR_STORE_PATH.open("r", encoding="utf-8") as f:
-        data = json.load(f)
+    if ijson is not None and limit and VECTOR_STORE_PATH.stat().st_size > STREAM_THRESHOLD_BYTES:
+        streamed = _stream_first_entries(limit)
+        if streamed is not None:
+            pairs, metadata_dict = streamed
+            docstore = load_docstore()
+            print(f"Streaming first {len(pairs)} entries from {VECTOR_STORE_PATH}")
+            for idx, (key, value) in enumerate(pairs, start=1):
+                text, metadata = extract_payload(key, value, docstore, metadata_dict)
+                print_entry(idx, limit, key, text, metadata)
+            return
+
+    data = _load_vector_store()
 
     entries = extract_entries(data)
     docstore = load_docstore()
@@ -155,23 +242,8 @@ def main(limit: int = 10) -> None:
         if idx > limit:
             break
         text, metadata = extract_payload(key, value, docstore, metadata_dict)
-
-        print("-" * 80)
         denominator = limit if limit else total_entries
-        print(f"Entry {idx}/{denominator} | Vector ID: {key}")
-        if text:
-            snippet = text.strip()
-            print(f"Text (first 400 chars):\n{snippet[:400]}\n")
-            if len(snippet) > 400:
-                print("...")
-        else:
-            print("[No text payload found]")
-        if metadata:
-            print("Metadata:")
-            for m_key, m_value in metadata.items():
-                print(f"  {m_key}: {m_value}")
-        else:
-            print("[No metadata]")
+        print_entry(idx, denominator, key, text, metadata)
 
 
 if __name__ == "__main__":
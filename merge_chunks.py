@@ -6,6 +6,8 @@ For each directory under ./chunk named like "<prefix>_chunk_<nn>", this script:
     with de-duplication, into output/<prefix>/doc.md.
     De-duplication key: the first non-empty line (exact match) across all chunks of
     the same prefix; first occurrence wins, later duplicates are skipped.
+    Per-page dedup keys are cached in output/<prefix>/.merge_cache.json (keyed by
+    mtime + size), so unchanged duplicate pages are not re-read on later runs.
 2) copies all images from each chunk's imgs/ folder into output/<prefix>/imgs/
     using original filenames (to keep doc.md image paths valid).
 
@@ -14,106 +16,261 @@ Usage:
 Optional env vars:
   CHUNK_ROOT: source chunk root (default: ./chunk)
   OUTPUT_ROOT: output root (default: ./output)
+  MERGE_WORKERS: worker processes for prefixes (default: CPU count; 1 = serial)
 """
 
+import hashlib
+import json
+import mmap
 import os
 import re
 import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from operator import itemgetter
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 CHUNK_ROOT = Path(os.getenv("CHUNK_ROOT", "./chunk")).resolve()
 OUTPUT_ROOT = Path(os.getenv("OUTPUT_ROOT", "./output")).resolve()
 CHUNK_PATTERN = re.compile(r"^(?P<prefix>.+)_chunk_(?P<num>\d+)$")
 MIN_SECTION_LEN = int(os.getenv("MIN_SECTION_LEN", "500"))
-
-
-def find_chunk_groups(chunk_root: Path) -> Dict[str, List[Tuple[int, Path]]]:
-    groups: Dict[str, List[Tuple[int, Path]]] = {}
-    for entry in chunk_root.iterdir():
-        if not entry.is_dir():
-            continue
-        m = CHUNK_PATTERN.match(entry.name)
-        if not m:
-            continue
-        prefix = m.group("prefix")
-        num = int(m.group("num"))
-        groups.setdefault(prefix, []).append((num, entry))
-    for prefix in groups:
-        groups[prefix].sort(key=lambda x: x[0])
+MERGE_WORKERS = int(os.getenv("MERGE_WORKERS", "0")) or os.cpu_count() or 1
+IMG_COPY_THREADS = min(32, (os.cpu_count() or 1) * 4)
+# 带捕获组：re.split 一次返回 [前言, 标题1, 正文1, 标题2, 正文2, ...]
+HEADING_SPLIT_RE = re.compile(r"(?m)^(# .+)$")
+SUMMARY_RE = re.compile(r"(?im)^##\s*summary\b")
+SLUG_RE = re.compile(r"[^a-zA-Z0-9]+")
+# ASCII 标题走 str.translate：非字母数字映射为 "_"，再 split/join 压缩并去掉首尾下划线
+SLUG_TABLE = str.maketrans({chr(c): "_" for c in range(128) if not chr(c).isalnum()})
+
+
+def find_chunk_groups(chunk_root: Path) -> Dict[str, List["ChunkScan"]]:
+    folders: Dict[str, List[Tuple[int, Path]]] = {}
+    with os.scandir(chunk_root) as it:
+        for entry in it:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            m = CHUNK_PATTERN.match(entry.name)
+            if not m:
+                continue
+            prefix = m.group("prefix")
+            num = int(m.group("num"))
+            folders.setdefault(prefix, []).append((num, Path(entry.path)))
+    groups: Dict[str, List[ChunkScan]] = {}
+    for prefix, chunks in folders.items():
+        chunks.sort(key=itemgetter(0))
+        # 每个 chunk 目录只遍历一次，同时得到页面与图片清单
+        groups[prefix] = [scan_chunk_folder(num, folder) for num, folder in chunks]
     return groups
 
 
 DOC_FILE_RE = re.compile(r"^doc_(?P<num>\d+)\.md$")
+WATERMARK = "唯一淘宝店铺：艾米学社"
+WATERMARK_BYTES = WATERMARK.encode("utf-8")
+# 水印与换行组成的连续片段：含换行则替换为单个换行，否则直接删除。
+# 一次扫描等价于「删除水印后再把连续换行压成一个」
+WATERMARK_RUN_RE = re.compile(rf"(?:\n|{re.escape(WATERMARK)})+")
+# 去重预判只解码文件开头这么多字节
+PEEK_BYTES = 4096
+MANIFEST_NAME = ".merge_cache.json"
+
+# (doc_num, path, mtime_ns, size)
+PageEntry = Tuple[int, Path, int, int]
+# (chunk_num, folder, 按页码排序的 doc_*.md, imgs/ 下的 (文件名, 路径)；缺少 imgs/ 时为 None)
+ChunkScan = Tuple[int, Path, List[PageEntry], Optional[List[Tuple[str, str]]]]
+
+
+def scan_chunk_folder(num: int, folder: Path) -> ChunkScan:
+    pages: List[PageEntry] = []
+    has_imgs = False
+    with os.scandir(folder) as it:
+        for entry in it:
+            if entry.name == "imgs":
+                has_imgs = entry.is_dir()
+                continue
+            m = DOC_FILE_RE.match(entry.name)
+            if not m or not entry.is_file():
+                continue
+            st = entry.stat()
+            pages.append((int(m.group("num")), Path(entry.path), st.st_mtime_ns, st.st_size))
+    pages.sort(key=itemgetter(0))
+
+    images: Optional[List[Tuple[str, str]]] = None
+    if has_imgs:
+        with os.scandir(folder / "imgs") as it:
+            images = [(img.name, img.path) for img in it if img.is_file()]
+    return num, folder, pages, images
 
 
 def _first_line_key(text: str) -> str | None:
     """Use the first non-empty line as the dedup key."""
-    for line in text.splitlines():
-        cleaned = line.strip()
+    # 逐行向后查找，不为整页构建行列表
+    pos = 0
+    n = len(text)
+    while pos < n:
+        nl = text.find("\n", pos)
+        end = n if nl < 0 else nl
+        cleaned = text[pos:end].strip()
         if cleaned:
-            return cleaned
+            # 与 splitlines 保持一致：\r、\u2028 等也视为行边界
+            return cleaned.splitlines()[0].strip()
+        if nl < 0:
+            return None
+        pos = nl + 1
     return None
 
 
-def concat_docs(chunks: List[Tuple[int, Path]], out_doc: Path) -> None:
-    parts: List[str] = []
-    seen: set[str] = set()
+def _decode_page(data: bytes) -> str:
+    """Decode like Path.read_text(errors="ignore"): UTF-8 plus universal newlines."""
+    text = data.decode("utf-8", errors="ignore")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def _peek_first_line_key(mm: mmap.mmap) -> str | None:
+    """Dedup key from the file head only; None when the head is not conclusive.
+
+    Only complete lines are considered, and heads containing the watermark are left to
+    the full path, since removing it may change which line comes first.
+    """
+    head = mm[:PEEK_BYTES]
+    cut = head.rfind(b"\n")
+    if cut < 0:
+        return None
+    head = head[:cut]
+    if WATERMARK_BYTES in head:
+        return None
+    return _first_line_key(_decode_page(head))
+
+
+def _key_hash(key: str) -> int:
+    """Stable 64-bit hash of a dedup key (persisted in the manifest, so builtin hash() won't do)."""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _load_manifest(path: Path) -> Dict[str, list]:
+    try:
+        data = json.loads(path.read_bytes())
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _collapse_watermark_run(m: "re.Match[str]") -> str:
+    return "\n" if "\n" in m.group() else ""
+
+
+def _read_page(path: Path, seen: set[int]) -> Tuple[Optional[str], Optional[int]]:
+    """Read and clean one page; returns (text, dedup key hash).
+
+    text is None when the page is empty or was already recognised as a duplicate from its head.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None, None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # 重复页只需看首行即可跳过，无需解码全文
+            head_key = _peek_first_line_key(mm)
+            if head_key is not None:
+                head_h = _key_hash(head_key)
+                if head_h in seen:
+                    return None, head_h
+            # 在原始字节上判断水印，绝大多数无水印页可跳过整段清洗分支
+            has_watermark = mm.find(WATERMARK_BYTES) != -1
+            raw = _decode_page(mm[:]).strip()
+    # Remove known watermark lines/phrases
+    if has_watermark and raw:
+        # 去掉水印后留下的空行一次性压缩（连续多个换行也只保留一个）
+        raw = WATERMARK_RUN_RE.sub(_collapse_watermark_run, raw).strip()
+    key = _first_line_key(raw) if raw else None
+    if key is None:
+        return None, None
+    return raw, _key_hash(key)
+
+
+def concat_docs(chunks: List[ChunkScan], out_doc: Path) -> None:
+    # 只保存首行的 64 位哈希，不保留整行字符串
+    seen: set[int] = set()
     skipped = 0
-
-    for chunk_num, folder in chunks:
-        candidates: List[Tuple[int, Path]] = []
-        for entry in folder.iterdir():
-            if not entry.is_file():
-                continue
-            m = DOC_FILE_RE.match(entry.name)
-            if not m:
-                continue
-            doc_num = int(m.group("num"))
-            candidates.append((doc_num, entry))
-
-        for doc_num, path in sorted(candidates, key=lambda x: x[0]):
-            raw = path.read_text(encoding="utf-8", errors="ignore").strip()
-            if not raw:
-                continue
-            # Remove known watermark lines/phrases
-            watermark = "唯一淘宝店铺：艾米学社"
-            if watermark in raw:
-                raw = raw.replace(watermark, "")
-                raw = raw.replace("\n\n", "\n").strip()
-            if not raw:
-                continue
-            key = _first_line_key(raw)
-            if key is None:
-                continue
-            if key in seen:
-                skipped += 1
-                continue
-            seen.add(key)
-            header = f"<!-- chunk {chunk_num:02d} {path.name} from {folder.name} -->\n"
-            parts.append(header + raw)
-            # No per-page output; only merged doc.md is written.
+    pages_written = 0
 
     out_doc.parent.mkdir(parents=True, exist_ok=True)
-    out_doc.write_text("\n\n".join(parts), encoding="utf-8")
-    print(f"[doc ] wrote {out_doc} ({len(parts)} pages, skipped {skipped} dups)")
-
-
-def copy_images(chunks: List[Tuple[int, Path]], out_img_dir: Path) -> None:
+    # 上次运行的 {chunk目录/文件名: [mtime_ns, size, 首行哈希]}，文件未变化时复用
+    manifest_path = out_doc.parent / MANIFEST_NAME
+    manifest = _load_manifest(manifest_path)
+    new_manifest: Dict[str, list] = {}
+
+    # 逐页直接写入输出文件，峰值内存只与单页大小相关
+    # 二进制写入 + 1 MiB 缓冲：逐页自行编码，省去文本层的额外编码缓冲
+    with open(out_doc, "wb", buffering=1 << 20) as out:
+        for chunk_num, folder, pages, _ in chunks:
+            for doc_num, path, mtime_ns, size in pages:
+                rel = f"{folder.name}/{path.name}"
+                cached = manifest.get(rel)
+                if isinstance(cached, list) and len(cached) == 3 and cached[:2] == [mtime_ns, size]:
+                    # 文件未变化：空页与重复页直接跳过，无需打开文件
+                    new_manifest[rel] = cached
+                    if cached[2] is None:
+                        continue
+                    if cached[2] in seen:
+                        skipped += 1
+                        continue
+
+                raw, key_h = _read_page(path, seen)
+                new_manifest[rel] = [mtime_ns, size, key_h]
+                if key_h is None:
+                    continue
+                if raw is None or key_h in seen:
+                    skipped += 1
+                    continue
+                seen.add(key_h)
+                if pages_written:
+                    out.write(b"\n\n")
+                out.write(f"<!-- chunk {chunk_num:02d} {path.name} from {folder.name} -->\n".encode("utf-8"))
+                out.write(raw.encode("utf-8"))
+                pages_written += 1
+                # No per-page output; only merged doc.md is written.
+
+    manifest_path.write_text(json.dumps(new_manifest), encoding="utf-8")
+    print(f"[doc ] wrote {out_doc} ({pages_written} pages, skipped {skipped} dups)")
+
+
+def link_or_copy(src: str, dst: Path) -> None:
+    """Hardlink src to dst; fall back to a real copy (e.g. across filesystems).
+
+    Images are never modified after merging, so sharing the inode is safe and moves no bytes.
+    """
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        # 与 copy2 一致：同名目标直接覆盖
+        os.unlink(dst)
+        link_or_copy(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _link_all(sources: Dict[str, str], out_dir: Path) -> None:
+    """Link/copy {filename: src_path} into out_dir concurrently (copies block in the kernel, not the GIL)."""
+    with ThreadPoolExecutor(max_workers=IMG_COPY_THREADS) as ex:
+        list(ex.map(lambda item: link_or_copy(item[1], out_dir / item[0]), sources.items()))
+
+
+def copy_images(chunks: List[ChunkScan], out_img_dir: Path) -> None:
     out_img_dir.mkdir(parents=True, exist_ok=True)
     count = 0
-    for num, folder in chunks:
-        img_dir = folder / "imgs"
-        if not img_dir.exists():
+    # 直接使用原名，避免破坏 doc.md 中的图片路径；重名概率极低，若发生则后面的 chunk 覆盖前面的。
+    # 先按文件名收集，重名只保留最后一个，并发复制时不会争抢同一目标。
+    sources: Dict[str, str] = {}
+    for num, folder, _, images in chunks:
+        if images is None:
             print(f"[warn] missing imgs/ in {folder}")
             continue
-        for img in img_dir.iterdir():
-            if not img.is_file():
-                continue
-            target = out_img_dir / img.name
-            # 直接使用原名，避免破坏 doc.md 中的图片路径；重名概率极低，若发生则覆盖。
-            shutil.copy2(img, target)
-            count += 1
+        for name, path in images:
+            sources[name] = path
+        count += len(images)
+    _link_all(sources, out_img_dir)
     print(f"[imgs] copied {count} images to {out_img_dir}")
 
 
@@ -123,14 +280,10 @@ def mirror_images_for_papers(src_img_dir: Path, paper_img_dir: Path) -> None:
         print(f"[warn] source imgs missing: {src_img_dir}")
         return
     paper_img_dir.mkdir(parents=True, exist_ok=True)
-    count = 0
-    for img in src_img_dir.iterdir():
-        if not img.is_file():
-            continue
-        target = paper_img_dir / img.name
-        shutil.copy2(img, target)
-        count += 1
-    print(f"[imgs] mirrored {count} images to {paper_img_dir}")
+    with os.scandir(src_img_dir) as it:
+        sources = {img.name: img.path for img in it if img.is_file()}
+    _link_all(sources, paper_img_dir)
+    print(f"[imgs] mirrored {len(sources)} images to {paper_img_dir}")
 
 
 def process_all(chunk_root: Path, output_root: Path) -> None:
@@ -140,12 +293,32 @@ def process_all(chunk_root: Path, output_root: Path) -> None:
     if not groups:
         print("no chunk groups found")
         return
-    for prefix, chunks in groups.items():
-        out_dir = output_root / prefix
-        concat_docs(chunks, out_dir / "doc.md")
-        copy_images(chunks, out_dir / "imgs")
-        mirror_images_for_papers(out_dir / "imgs", out_dir / "papers" / "imgs")
-        postprocess_sections(out_dir / "doc.md", out_dir / "papers")
+    # 各 prefix 的输出目录与去重集合互不相关，可分发到多进程并行处理
+    if MERGE_WORKERS == 1 or len(groups) <= 1:
+        for prefix, chunks in groups.items():
+            _process_one_prefix(prefix, chunks, output_root)
+        return
+    with ProcessPoolExecutor(max_workers=min(MERGE_WORKERS, len(groups))) as pool:
+        futures = [
+            pool.submit(_process_one_prefix, prefix, chunks, output_root)
+            for prefix, chunks in groups.items()
+        ]
+        for fut in as_completed(futures):
+            fut.result()
+
+
+def _process_one_prefix(prefix: str, chunks: List[ChunkScan], output_root: Path) -> None:
+    out_dir = output_root / prefix
+    concat_docs(chunks, out_dir / "doc.md")
+    copy_images(chunks, out_dir / "imgs")
+    mirror_images_for_papers(out_dir / "imgs", out_dir / "papers" / "imgs")
+    postprocess_sections(out_dir / "doc.md", out_dir / "papers")
+
+
+def _slugify(title: str) -> str:
+    if title.isascii():
+        return "_".join(filter(None, title.translate(SLUG_TABLE).split("_"))).lower()
+    return SLUG_RE.sub("_", title).strip("_").lower()
 
 
 def postprocess_sections(merged_doc: Path, out_dir: Path) -> None:
@@ -158,8 +331,8 @@ def postprocess_sections(merged_doc: Path, out_dir: Path) -> None:
         print(f"[warn] merged doc not found: {merged_doc}")
         return
     text = merged_doc.read_text(encoding="utf-8", errors="ignore")
-    matches = list(re.finditer(r"(?m)^# .+", text))
-    if not matches:
+    parts = HEADING_SPLIT_RE.split(text)
+    if len(parts) == 1:
         print(f"[warn] no level-1 headings found in {merged_doc}")
         return
 
@@ -168,33 +341,35 @@ def postprocess_sections(merged_doc: Path, out_dir: Path) -> None:
     skipped_short = 0
     skipped_no_summary = 0
     passed_gate = False
+    used_slugs: set[str] = set()
 
-    for idx, m in enumerate(matches):
-        start = m.start()
-        end = matches[idx + 1].start() if idx + 1 < len(matches) else len(text)
-        section = text[start:end].strip()
-        if not section:
-            continue
-
-        title = m.group().lstrip("#").strip()
-        slug_base = re.sub(r"[^a-zA-Z0-9]+", "_", title).strip("_").lower() or f"section_{idx+1:03d}"
-
+    for idx, (heading, body) in enumerate(zip(parts[1::2], parts[2::2])):
         if not passed_gate:
-            if len(section) < MIN_SECTION_LEN:
+            # 门槛判断直接用标题与正文片段，不为被跳过的章节拼接/strip
+            # （长度含末尾空白，相对 MIN_SECTION_LEN 可忽略；## summary 只可能出现在正文中）
+            if len(heading) + len(body) < MIN_SECTION_LEN:
                 skipped_short += 1
                 continue
-            if not re.search(r"(?im)^##\s*summary\b", section):
+            if not SUMMARY_RE.search(body):
                 skipped_no_summary += 1
                 continue
             passed_gate = True
 
+        # slug 只为保留下来的章节计算
+        title = heading.lstrip("#").strip()
+        slug_base = _slugify(title) or f"section_{idx+1:03d}"
+
+        # 在内存中保证 slug 唯一，不再逐个 stat 目标文件
         slug = slug_base
         suffix = 1
-        while (out_dir / f"{kept+1:03d}_{slug}.md").exists():
+        while slug in used_slugs:
             slug = f"{slug_base}_{suffix}"
             suffix += 1
+        used_slugs.add(slug)
 
-        (out_dir / f"{kept+1:03d}_{slug}.md").write_text(section, encoding="utf-8")
+        # 标题行以 "# " 开头，只需去掉末尾空白
+        section = (heading + body).rstrip()
+        (out_dir / f"{kept+1:03d}_{slug}.md").write_bytes(section.encode("utf-8"))
         kept += 1
 
     print(
@@ -3,6 +3,8 @@ Quick preview of parent blocks and child chunks without building embeddings.
 """
 
 import argparse
+from itertools import islice
+
 from rag_demo import MedicalRAGSystem
 
 
@@ -21,9 +23,10 @@ def preview(parents: int, children: int, data_dir: str, chunk_chars: int, snippe
         label = "full" if full else f"first {snippet} chars"
         print(f"Parent text {label}:\n{parent_display}\n")
 
-        children_nodes = rag._split_node_into_segments(parent)
-        print(f"Children count: {len(children_nodes)}")
-        for j, child in enumerate(children_nodes[:children], start=1):
+        # Lazily split: only the shown children are kept, the rest are just counted
+        children_iter = rag._iter_child_segments(parent)
+        shown = 0
+        for j, child in enumerate(islice(children_iter, children), start=1):
             meta = child.metadata or {}
             chunk_info = (
                 f"p_idx={meta.get('section_paragraph_index')}, "
@@ -36,8 +39,11 @@ def preview(parents: int, children: int, data_dir: str, chunk_chars: int, snippe
             label = "full" if full else f"first {snippet} chars"
             print(f"  Child {j}/{children} ({chunk_info}) {label}:")
             print(f"  {child_display}\n")
-        if len(children_nodes) > children:
-            print(f"  ... skipped {len(children_nodes) - children} more children for this parent")
+            shown = j
+        remaining = sum(1 for _ in children_iter)
+        print(f"Children count: {shown + remaining}")
+        if remaining:
+            print(f"  ... skipped {remaining} more children for this parent")
 
 
 def main():
@@ -4,13 +4,22 @@
 使用基于markdown标题的分块策略
 """
 
+import asyncio
+import hashlib
+import importlib.util
 import json
-import math
 import os
 import re
-from collections import defaultdict
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Sequence, Set, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+import numpy as np
 from dotenv import load_dotenv
 from llama_index.core import (
     VectorStoreIndex,
@@ -19,25 +28,363 @@ from llama_index.core import (
     load_index_from_storage,
     Settings,
 )
-from llama_index.core.schema import TextNode
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
 from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.llms.openai import OpenAI
-from rank_bm25 import BM25Okapi
+from llama_index.embeddings.openai.base import aget_embeddings, get_embeddings
+
+from segmenter import chunk_paragraph, iter_segments
+
+try:
+    import orjson
+except ImportError:  # 可选加速：未安装时回退到标准库 json
+    orjson = None
+
+try:
+    import simsimd
+except ImportError:  # 可选加速：未安装时用 numpy（BLAS）计算余弦与汉明距离
+    simsimd = None
+
+try:
+    import hnswlib
+except ImportError:  # 可选：未安装时 enable_hnsw_ann 不可用
+    hnswlib = None
+
+# 只探测 numba / bm25s 是否可装载，不在此处导入（bm25s 会连带导入 scipy，较慢）
+BM25S_BACKEND = "numba" if importlib.util.find_spec("numba") is not None else "numpy"
+# 可选加速：未安装（或无法导入）bm25s 时使用内置的 SparseBM25，实际是否可用以 _bm25s() 为准
+HAS_BM25S = importlib.util.find_spec("bm25s") is not None
+
+# 关键词索引的持久化文件（位于 persist_dir 下）
+KEYWORD_INDEX_FILE = "keyword_index.json"
+BM25S_INDEX_DIR = "bm25s_index"
+KEYWORD_TOKENS_FILE = "keyword_tokens.npz"
+# 元信息抽取的 LLM 结果缓存（按模型 + 抽取字段 + 正文哈希）
+LLM_EXTRACT_CACHE_FILE = "llm_extract_cache.sqlite"
+# 查询向量的磁盘缓存（按模型 + 查询文本哈希），跨进程复用
+QUERY_EMBED_CACHE_FILE = "query_embed_cache.sqlite"
+# 语义回答缓存（enable_query_cache(persist=True) 时使用）
+SEMANTIC_CACHE_FILE = "semantic_cache.npz"
+# HNSW 向量图索引及其 node_id 列表（enable_hnsw_ann 时使用）
+HNSW_INDEX_FILE = "vector_hnsw.bin"
+HNSW_IDS_FILE = "vector_hnsw_ids.json"
+
+# query_enterprise 的固定指令前缀：始终放在提示词最前面且逐字节不变，
+# 使 OpenAI 的自动提示缓存或 vLLM（--enable-prefix-caching）等服务端能复用这段前缀的 KV
+ENTERPRISE_SYSTEM_PROMPT = "你是医学论文助手。请基于下列上下文回答用户问题，如果无法确定答案请说明未知。\n\n"
+# 提示词模板的固定片段预先编码为 UTF-8，与上下文字节一起写入同一个 bytearray
+ENTERPRISE_PROMPT_HEAD = f"{ENTERPRISE_SYSTEM_PROMPT}上下文:\n".encode("utf-8")
+ENTERPRISE_PROMPT_MID = "\n\n问题: ".encode("utf-8")
+ENTERPRISE_PROMPT_TAIL = "\n回答:".encode("utf-8")
+CONTEXT_SEP = b"\n\n"
+# query_enterprise / aquery_enterprise 共用的检索参数：两路候选数、融合后保留数与融合权重
+ENTERPRISE_TOP_K_VECTOR = 20
+ENTERPRISE_TOP_K_KEYWORD = 20
+ENTERPRISE_MERGE_TOP_K = 5
+ENTERPRISE_ALPHA = 0.85
+ENTERPRISE_BETA = 0.15
+
+# 标题正则：模块加载时编译一次（表格/段落/句子切分的正则见 segmenter.py）
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$", re.MULTILINE)
+# 元信息抽取相关正则
+DOI_RE = re.compile(r"10\.\d{4,9}/\S+", re.IGNORECASE)
+DOC_ID_SUFFIX_RE = re.compile(r"_(h\d+|preface|tbl\d+|p\d+_\d+)$")
+# LLM 输出中的 JSON 对象解码器（无状态，可跨线程复用）
+JSON_DECODER = json.JSONDecoder()
+# BM25 分词：token_pattern 未命中任何词时的回退规则
+FALLBACK_TOKEN_RE = re.compile(r"\w{2,}")
+
+
+@lru_cache(maxsize=1)
+def _bm25s() -> Any:
+    """按需导入 bm25s，只有真正构建/加载关键词索引时才付出导入开销；未安装或导入失败（如 scipy 缺失）时返回 None。"""
+    if not HAS_BM25S:
+        return None
+    try:
+        import bm25s
+    except ImportError:
+        return None
+    return bm25s
+
+
+@lru_cache(maxsize=100_000)
+def _doc_id_from_node_id(node_id: str) -> str:
+    """去掉节点 id 的块后缀（_h3 / _preface / _tbl1 / _p2_0 等）得到文档 id。"""
+    return DOC_ID_SUFFIX_RE.sub("", node_id)
+
+
+def _tokenize(token_re: "re.Pattern[str]", text: str) -> List[str]:
+    """BM25 分词：整段转小写一次后匹配；token_re 无命中时回退到 FALLBACK_TOKEN_RE。"""
+    text = text.lower()
+    return token_re.findall(text) or FALLBACK_TOKEN_RE.findall(text)
+
+
+@lru_cache(maxsize=4096)
+def _tokenize_query(token_re: "re.Pattern[str]", query: str) -> Tuple[str, ...]:
+    return tuple(_tokenize(token_re, query))
+
+
+def quantize_int8(embedding: Sequence[float]) -> np.ndarray:
+    """L2 归一化后按 127 缩放为 int8，内存为 float32 的 1/4；余弦相似度对缩放不敏感，可直接在量化向量上计算。"""
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    if norm > 0:
+        vec = vec / norm
+    return np.clip(np.rint(vec * 127.0), -127, 127).astype(np.int8)
+
+
+def _join_bytes(parts: Sequence[Any], sep: bytes = b"") -> bytearray:
+    """把若干 bytes-like 片段（可用 sep 分隔）写入按总长预分配的 bytearray，避免逐段拼接时的重复分配。"""
+    if not parts:
+        return bytearray()
+    buf = bytearray(sum(len(p) for p in parts) + len(sep) * (len(parts) - 1))
+    off = 0
+    for j, data in enumerate(parts):
+        if j and sep:
+            buf[off:off + len(sep)] = sep
+            off += len(sep)
+        buf[off:off + len(data)] = data
+        off += len(data)
+    return buf
+
+
+def cosine_scores(query: Sequence[float], matrix: np.ndarray) -> np.ndarray:
+    """query 与 matrix 每一行的余弦相似度（float32）；matrix 为 int8 时查询向量同样量化为 int8。
+
+    安装了 simsimd 时走其 SIMD 内核（int8 直接计算，无需先升为 float32），否则升为 float32 后走 BLAS。
+    """
+    if len(matrix) == 0:
+        return np.empty(0, dtype=np.float32)
+    if simsimd is not None:
+        if matrix.dtype == np.int8:
+            q = quantize_int8(query)
+        else:
+            q = np.asarray(query, dtype=matrix.dtype)
+        dist = np.asarray(simsimd.cdist(q[None, :], np.ascontiguousarray(matrix), metric="cosine"))[0]
+        return (1.0 - dist).astype(np.float32)
+    mat = matrix.astype(np.float32, copy=False)
+    q = np.asarray(query, dtype=np.float32)
+    denom = np.linalg.norm(mat, axis=1) * float(np.linalg.norm(q))
+    return np.divide(mat @ q, denom, out=np.zeros(len(mat), dtype=np.float32), where=denom > 0)
+
+
+class ParentTextStore(Mapping):
+    """父块原文的只读映射：所有文本按 UTF-8 连续存放在一个 bytes 中，配合偏移数组切片。
+
+    对外与 ``Dict[str, str]`` 用法一致（get / in / items / len）；上下文拼接时可用
+    get_bytes / get_view 直接取编码后的字节，省去逐段 encode。
+    """
+
+    def __init__(self, items: Iterable[Tuple[str, str]]) -> None:
+        self._rows: Dict[str, int] = {}
+        chunks: List[bytes] = []
+        for pid, text in items:
+            if pid in self._rows:
+                # 与 dict 一致：重复键以后者为准
+                chunks[self._rows[pid]] = (text or "").encode("utf-8")
+                continue
+            self._rows[pid] = len(chunks)
+            chunks.append((text or "").encode("utf-8"))
+        self._offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+        np.cumsum([len(c) for c in chunks], out=self._offsets[1:])
+        self._blob = b"".join(chunks)
+        self._view = memoryview(self._blob)
+
+    def get_bytes(self, pid: str) -> Optional[bytes]:
+        row = self._rows.get(pid)
+        if row is None:
+            return None
+        return self._blob[self._offsets[row]:self._offsets[row + 1]]
+
+    def get_view(self, pid: str) -> Optional[memoryview]:
+        """与 get_bytes 相同，但返回 blob 上的零拷贝视图。"""
+        row = self._rows.get(pid)
+        if row is None:
+            return None
+        return self.view_at(row)
+
+    def rows_of(self, pids: Sequence[Optional[str]]) -> np.ndarray:
+        """把父块 id 批量换成稠密行号（int32），空或未知的 id 记为 -1。"""
+        rows = self._rows
+        return np.fromiter((rows.get(pid, -1) if pid else -1 for pid in pids), dtype=np.int32, count=len(pids))
+
+    def view_at(self, row: int) -> memoryview:
+        return self._view[self._offsets[row]:self._offsets[row + 1]]
+
+    def __getitem__(self, pid: str) -> str:
+        data = self.get_bytes(pid)
+        if data is None:
+            raise KeyError(pid)
+        return data.decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
 
 
 class RetrievalHit:
     """统一的检索结果封装，包含向量分、关键词分和融合分。"""
 
+    __slots__ = ("node", "vec_score", "kw_score", "kw_raw", "score", "parent_text")
+
     def __init__(self, node: TextNode, vec_score: float = 0.0, kw_score: float = 0.0, kw_raw: float = 0.0):
         self.node = node
         self.vec_score = vec_score or 0.0
         self.kw_score = kw_score or 0.0  # 已平滑后的关键词分
         self.kw_raw = kw_raw or 0.0      # 未平滑的原始关键词累计（命中/回退得分）
         self.score = 0.0                 # 融合后的总分
+        self.parent_text = ""            # 所属父块原文（缺失时为子块原文）
+
+
+def _bm25_score_top_k(
+    q_ids: np.ndarray,
+    term_ptr: np.ndarray,
+    post_docs: np.ndarray,
+    post_weights: np.ndarray,
+    n_docs: int,
+    k: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """倒排累加 + 大小为 k 的最小堆选前 k，返回按得分降序的 (文档下标, 得分)。
+
+    只用标量循环与 numpy 数组，可直接交给 numba.njit 编译（见 _bm25_numba_kernel）。
+    """
+    scores = np.zeros(n_docs)
+    for t in q_ids:
+        for j in range(term_ptr[t], term_ptr[t + 1]):
+            scores[post_docs[j]] += post_weights[j]
+
+    heap_idx = np.empty(k, dtype=np.int64)
+    heap_val = np.empty(k)
+    size = 0
+    for d in range(n_docs):
+        v = scores[d]
+        if size < k:
+            # 上滤：新元素放到末尾，与父节点比较
+            pos = size
+            size += 1
+            while pos > 0:
+                parent = (pos - 1) // 2
+                if heap_val[parent] <= v:
+                    break
+                heap_val[pos] = heap_val[parent]
+                heap_idx[pos] = heap_idx[parent]
+                pos = parent
+            heap_val[pos] = v
+            heap_idx[pos] = d
+        elif v > heap_val[0]:
+            # 替换堆顶后下滤
+            pos = 0
+            while True:
+                child = 2 * pos + 1
+                if child >= k:
+                    break
+                if child + 1 < k and heap_val[child + 1] < heap_val[child]:
+                    child += 1
+                if heap_val[child] >= v:
+                    break
+                heap_val[pos] = heap_val[child]
+                heap_idx[pos] = heap_idx[child]
+                pos = child
+            heap_val[pos] = v
+            heap_idx[pos] = d
+
+    order = np.argsort(-heap_val[:size], kind="mergesort")
+    return heap_idx[:size][order], heap_val[:size][order]
+
+
+@lru_cache(maxsize=1)
+def _bm25_numba_kernel() -> Optional[Callable[..., Tuple[np.ndarray, np.ndarray]]]:
+    """首次使用时才导入 numba 并编译 _bm25_score_top_k；不可用时返回 None。"""
+    if BM25S_BACKEND != "numba":
+        return None
+    try:
+        import numba
+
+        return numba.njit(cache=True, fastmath=True)(_bm25_score_top_k)
+    except Exception:  # numba 与当前 numpy 版本不兼容等情况，回退到 numpy 路径
+        return None
+
+
+class SparseBM25:
+    """与 rank_bm25.BM25Okapi 打分一致的 BM25，基于共享词表的 int 词 id 与预计算的倒排权重。
+
+    建索引时为每个 (词项, 文档) 预先算好 idf * tf * (k1 + 1) / (tf + k1 * norm)，
+    按词项排成 CSC 式的三个数组（term_ptr / post_docs / post_weights）；
+    查询时每个词项只需一次切片 + 向量加法，不再逐文档做字符串哈希。
+    """
+
+    def __init__(
+        self,
+        token_ids: np.ndarray,
+        offsets: np.ndarray,
+        vocab_size: int,
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+        backend: str = BM25S_BACKEND,
+    ) -> None:
+        # backend="numba" 时 top_k 走 JIT 编译的累加 + 堆选择；"numpy" 为向量化实现
+        self.backend = backend
+        n_docs = len(offsets) - 1
+        self.n_docs = n_docs
+        doc_len = np.diff(offsets).astype(np.float64)
+        avgdl = float(doc_len.sum()) / n_docs if n_docs else 0.0
+
+        # (词项, 文档) 对去重计数得到 tf；结果按词项、再按文档排序
+        doc_of_token = np.repeat(np.arange(n_docs, dtype=np.int64), np.diff(offsets))
+        keys, tf = np.unique(token_ids.astype(np.int64) * max(n_docs, 1) + doc_of_token, return_counts=True)
+        terms = keys // max(n_docs, 1)
+        docs = keys % max(n_docs, 1)
+
+        # idf 与 BM25Okapi 相同：负 idf 替换为 epsilon * 平均 idf
+        df = np.bincount(terms, minlength=vocab_size).astype(np.float64)
+        idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+        if vocab_size:
+            idf[idf < 0] = epsilon * (idf.sum() / vocab_size)
+
+        norm = k1 * (1 - b + b * doc_len / avgdl) if avgdl else np.full(n_docs, k1)
+        self.term_ptr = np.concatenate(([0], np.cumsum(df))).astype(np.int64)
+        self.post_docs = docs
+        self.post_weights = idf[terms] * (tf * (k1 + 1)) / (tf + norm[docs])
+
+    def get_scores(self, q_ids: Sequence[int]) -> np.ndarray:
+        """q_ids 为查询词的词表 id（重复词按次数累加，与 BM25Okapi 一致）。"""
+        scores = np.zeros(self.n_docs)
+        term_ptr, post_docs, post_weights = self.term_ptr, self.post_docs, self.post_weights
+        for t in q_ids:
+            start, end = term_ptr[t], term_ptr[t + 1]
+            # 同一词项的倒排内文档各不相同，可直接花式索引累加
+            scores[post_docs[start:end]] += post_weights[start:end]
+        return scores
+
+    def top_k(self, q_ids: Sequence[int], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """返回按得分降序排列的 (文档下标, 得分)，长度为 min(k, n_docs)。"""
+        k = min(k, self.n_docs)
+        kernel = _bm25_numba_kernel() if self.backend == "numba" else None
+        if kernel is not None and k > 0:
+            return kernel(
+                np.asarray(q_ids, dtype=np.int64),
+                self.term_ptr,
+                self.post_docs,
+                self.post_weights,
+                self.n_docs,
+                k,
+            )
+        # 只需前 k 个：argpartition 线性选出候选，再仅对这 k 个排序
+        scores = self.get_scores(q_ids)
+        idx = np.argpartition(scores, -k)[-k:]
+        idx = idx[np.argsort(scores[idx])[::-1]]
+        return idx, scores[idx]
 
 
 class BM25KeywordIndexer:
-    """本地 BM25 关键词/词袋检索，无需 LLM 与网络。"""
+    """本地 BM25 关键词/词袋检索，无需 LLM 与网络。
+
+    安装了 bm25s 时使用其稀疏矩阵后端：建索引时预计算每个词项在各文档上的得分（CSR），
+    查询只需按词项取行求和；否则使用内置的 SparseBM25（同样基于 int 词 id 与预计算权重）。
+    """
 
     def __init__(
         self,
@@ -46,8 +393,10 @@ class BM25KeywordIndexer:
         boost_header: bool = True,
     ) -> None:
         self.token_pattern = token_pattern
+        self._token_re = re.compile(token_pattern)
         self.boost_header = boost_header
-        self.node_lookup: Dict[str, TextNode] = {n.node_id: n for n in nodes}
+        # 三个列表按 BM25 文档下标对齐：检索结果的下标直接取节点，无需再按 id 查字典
+        self.nodes: List[TextNode] = []
         self.node_ids: List[str] = []
         self.tokenized_docs: List[List[str]] = []
 
@@ -55,23 +404,129 @@ class BM25KeywordIndexer:
             tokens = self._tokenize_node(node)
             if not tokens:
                 continue
+            self.nodes.append(node)
             self.node_ids.append(node.node_id)
             self.tokenized_docs.append(tokens)
 
-        self.bm25 = BM25Okapi(self.tokenized_docs) if self.tokenized_docs else None
+        self.backend = "bm25s" if _bm25s() is not None else "sparse"
+        self.loaded_from_disk = False
+        self.content_digest = self.compute_digest(nodes, token_pattern, boost_header)
+        # sparse 后端：共享词表 + 扁平 int32 词 id + 每篇文档的起止偏移
+        self.vocab: Dict[str, int] = {}
+        self._token_ids = np.empty(0, dtype=np.int32)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self.bm25 = self._build_bm25(self.tokenized_docs) if self.tokenized_docs else None
+
+    def _build_bm25(self, tokenized_docs: List[List[str]]):
+        if self.backend == "bm25s":
+            bm25 = _bm25s().BM25(backend=BM25S_BACKEND)
+            bm25.index(tokenized_docs, show_progress=False)
+            return bm25
+        self.vocab, self._token_ids, self._offsets = self._encode_tokenized(tokenized_docs)
+        return SparseBM25(self._token_ids, self._offsets, len(self.vocab))
+
+    @staticmethod
+    def compute_digest(nodes: Sequence[TextNode], token_pattern: str, boost_header: bool) -> str:
+        """分词配置 + 各节点 (id, 标题, 正文) 的摘要；任一节点增删、改动或顺序变化都会改变摘要。"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{token_pattern}\0{int(bool(boost_header))}\0".encode("utf-8"))
+        for node in nodes:
+            header = node.metadata.get("section_header", "") if node.metadata else ""
+            for part in (node.node_id, header or "", node.text or ""):
+                h.update(part.encode("utf-8"))
+                h.update(b"\0")
+        return h.hexdigest()
 
     @classmethod
-    def from_disk(cls, data: Dict[str, Any], nodes: Sequence[TextNode]) -> "BM25KeywordIndexer":
-        # 若存在磁盘数据可用则加载，否则直接重建（重建成本极低且完全本地）。
-        token_pattern = data.get("token_pattern", r"[a-zA-Z]{2,}") if isinstance(data, dict) else r"[a-zA-Z]{2,}"
-        instance = cls(nodes, token_pattern=token_pattern)
+    def from_disk(
+        cls,
+        data: Dict[str, Any],
+        nodes: Sequence[TextNode],
+        persist_dir: Optional[Path] = None,
+    ) -> "BM25KeywordIndexer":
+        # 只有磁盘上的索引与当前后端匹配、且由完全相同的节点（id、文本、顺序）与分词配置构建时才直接加载，
+        # 否则重建（重建成本低且完全本地）。
+        if not isinstance(data, dict):
+            data = {}
+        token_pattern = data.get("token_pattern", r"[a-zA-Z]{2,}")
+        boost_header = data.get("boost_header", True)
+        node_ids = data.get("node_ids") or []
+        backend = data.get("backend")
+        digest = cls.compute_digest(nodes, token_pattern, boost_header)
+        if persist_dir is None or data.get("content_digest") != digest:
+            return cls(nodes, token_pattern=token_pattern, boost_header=boost_header)
+        # 摘要一致时，已保存的 node_ids 应恰为当前节点中（分词非空者）按原顺序的子序列
+        node_lookup = {n.node_id: n for n in nodes}
+        stored = set(node_ids)
+        if len(stored) != len(node_ids) or node_ids != [n.node_id for n in nodes if n.node_id in stored]:
+            return cls(nodes, token_pattern=token_pattern, boost_header=boost_header)
+
+        bm25 = None
+        vocab: Dict[str, int] = {}
+        token_ids = np.empty(0, dtype=np.int32)
+        offsets = np.zeros(1, dtype=np.int64)
+        bm25s_module = _bm25s()
+        if backend == "bm25s" and bm25s_module is not None:
+            index_dir = persist_dir / BM25S_INDEX_DIR
+            if not index_dir.exists():
+                return cls(nodes, token_pattern=token_pattern, boost_header=boost_header)
+            bm25 = bm25s_module.BM25.load(str(index_dir)) if node_ids else None
+        elif backend == "sparse" and bm25s_module is None:
+            tokens_path = persist_dir / KEYWORD_TOKENS_FILE
+            if not tokens_path.exists():
+                return cls(nodes, token_pattern=token_pattern, boost_header=boost_header)
+            with np.load(tokens_path, allow_pickle=False) as arrays:
+                vocab = {tok: i for i, tok in enumerate(arrays["vocab"].tolist())}
+                offsets = arrays["offsets"]
+                token_ids = arrays["tokens"]
+            if len(offsets) - 1 != len(node_ids):
+                return cls(nodes, token_pattern=token_pattern, boost_header=boost_header)
+            bm25 = SparseBM25(token_ids, offsets, len(vocab)) if node_ids else None
+        else:
+            return cls(nodes, token_pattern=token_pattern, boost_header=boost_header)
+
+        instance = cls.__new__(cls)
+        instance.token_pattern = token_pattern
+        instance._token_re = re.compile(token_pattern)
+        instance.boost_header = boost_header
+        instance.content_digest = digest
+        instance.nodes = [node_lookup[node_id] for node_id in node_ids]
+        instance.node_ids = list(node_ids)
+        instance.tokenized_docs = []
+        instance.backend = backend
+        instance.vocab = vocab
+        instance._token_ids = token_ids
+        instance._offsets = offsets
+        instance.bm25 = bm25
+        instance.loaded_from_disk = True
         return instance
 
+    def save(self, persist_dir: Path) -> None:
+        """保存检索所需的二进制数据：bm25s 为预计算的稀疏得分矩阵，sparse 为词表 + int32 词 id。"""
+        if self.backend == "bm25s":
+            if self.bm25 is not None:
+                self.bm25.save(str(persist_dir / BM25S_INDEX_DIR))
+        else:
+            np.savez_compressed(
+                persist_dir / KEYWORD_TOKENS_FILE,
+                vocab=np.array(list(self.vocab), dtype=np.str_),
+                offsets=self._offsets,
+                tokens=self._token_ids,
+            )
+
+    @staticmethod
+    def _encode_tokenized(tokenized_docs: List[List[str]]) -> Tuple[Dict[str, int], np.ndarray, np.ndarray]:
+        """分词结果编码为 (词表, 扁平 int32 词 id, 每篇文档的起止偏移)。"""
+        vocab: Dict[str, int] = {}
+        flat_ids: List[int] = []
+        offsets = np.zeros(len(tokenized_docs) + 1, dtype=np.int64)
+        for i, tokens in enumerate(tokenized_docs):
+            flat_ids.extend(vocab.setdefault(tok, len(vocab)) for tok in tokens)
+            offsets[i + 1] = len(flat_ids)
+        return vocab, np.asarray(flat_ids, dtype=np.int32), offsets
+
     def _tokenize_text(self, text: str) -> List[str]:
-        tokens = re.findall(self.token_pattern, text.lower())
-        if not tokens:
-            tokens = re.findall(r"\w{2,}", text.lower())
-        return tokens
+        return _tokenize(self._token_re, text)
 
     def _tokenize_node(self, node: TextNode) -> List[str]:
         header = node.metadata.get("section_header", "") if node.metadata else ""
@@ -82,29 +537,447 @@ class BM25KeywordIndexer:
             combined = f"{header} {text}" if header else text
         return self._tokenize_text(combined)
 
+    def _score_top_k(self, q_tokens: List[str], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """返回按得分降序排列的 (文档下标, 原始得分) 两个数组，长度至多 top_k。"""
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+        k = min(top_k, len(self.node_ids))
+        if k <= 0:
+            return empty
+
+        if self.backend == "bm25s":
+            # 词表外的词项对得分无贡献，先过滤掉，全部未知时直接返回空
+            vocab = self.bm25.vocab_dict
+            q_tokens = [t for t in q_tokens if t in vocab]
+            if not q_tokens:
+                return empty
+            doc_ids, scores = self.bm25.retrieve([q_tokens], k=k, show_progress=False)
+            return doc_ids[0], scores[0]
+
+        vocab = self.vocab
+        q_ids = [vocab[t] for t in q_tokens if t in vocab]
+        if not q_ids:
+            return empty
+        return self.bm25.top_k(q_ids, k)
+
     def retrieve(self, query: str, top_k: int = 10) -> List[RetrievalHit]:
         if not self.bm25 or not self.node_ids:
             return []
 
-        q_tokens = self._tokenize_text(query)
+        # 查询分词结果按 (模式, 查询) 缓存，重复提问不再重新分词
+        q_tokens = list(_tokenize_query(self._token_re, query))
         if not q_tokens:
             return []
 
-        scores = self.bm25.get_scores(q_tokens)
-        ranked = sorted(enumerate(scores), key=lambda x: x[1], reverse=True)
-
-        hits: List[RetrievalHit] = []
-        for idx, raw_score in ranked[:top_k]:
-            if raw_score <= 0:
+        idx, raw_scores = self._score_top_k(q_tokens, top_k)
+        positive = raw_scores > 0
+        idx, raw_scores = idx[positive], raw_scores[positive]
+        kw_norms = np.log1p(raw_scores)
+
+        nodes = self.nodes
+        return [
+            RetrievalHit(node=nodes[i], kw_score=kw_norm, kw_raw=raw_score)
+            for i, raw_score, kw_norm in zip(idx.tolist(), raw_scores.tolist(), kw_norms.tolist())
+        ]
+
+
+class SemanticQueryCache:
+    """查询级语义缓存：问题向量与历史问题余弦相似度达到阈值即直接复用回答。
+
+    缓存键为 ``(namespace, int8 量化后的问题向量)``，namespace 由调用方传入
+    （模型名、top_k、response_mode 等查询配置），不同配置的回答互不复用。
+    add 时传入问题原文则另记一份「规范化问题文本 → 条目」的索引，lookup_text 可在
+    嵌入之前按文本精确命中。完全相同的问题向量直接按键命中；否则用全部缓存向量组成的矩阵一次矩阵乘法求相似度，
+    再在同一 namespace 内取最相似的条目。条目按 LRU 顺序保存，超过 ``ttl_seconds``
+    的条目视为过期。可通过 save/load 持久化为 npz，跨进程复用。
+    """
+
+    def __init__(self, threshold: float = 0.92, ttl_seconds: float = 300.0, max_entries: int = 256) -> None:
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # (namespace, 量化向量字节) -> (量化向量, 回答, 写入时间)
+        self._entries: "OrderedDict[Tuple[Any, bytes], Tuple[np.ndarray, str, float]]" = OrderedDict()
+        # 条目变化后惰性重建的 (N, D) 相似度矩阵及其行对应的键
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[Tuple[Any, bytes]] = []
+        # (namespace, 规范化问题文本) -> 条目键；条目被淘汰后对应文本自然失效
+        self._texts: "OrderedDict[Tuple[Any, str], Tuple[Any, bytes]]" = OrderedDict()
+
+    @staticmethod
+    def _normalize_text(question: str) -> str:
+        """忽略大小写与多余空白，使仅在格式上不同的问题共用同一条目。"""
+        return " ".join(question.lower().split())
+
+    def lookup_text(self, namespace: Any, question: str) -> Optional[str]:
+        """按规范化后的问题文本精确查找，命中时无需计算问题向量。"""
+        text_key = (namespace, self._normalize_text(question))
+        key = self._texts.get(text_key)
+        if key is None:
+            return None
+        cached = self._get_fresh(key, time.time())
+        if cached is None:
+            del self._texts[text_key]
+            return None
+        self._texts.move_to_end(text_key)
+        return cached
+
+    @staticmethod
+    def _quantize(embedding: Sequence[float]) -> np.ndarray:
+        return quantize_int8(embedding)
+
+    def _get_fresh(self, key: Tuple[Any, bytes], now: float) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry[2] > self.ttl_seconds:
+            del self._entries[key]
+            self._matrix = None
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _similarity_matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries)
+            if self._matrix_keys:
+                self._matrix = np.stack([self._entries[k][0] for k in self._matrix_keys]).astype(np.float32)
+            else:
+                self._matrix = np.empty((0, 0), dtype=np.float32)
+        return self._matrix
+
+    def lookup(self, namespace: Any, embedding: Sequence[float]) -> Optional[str]:
+        now = time.time()
+        qvec = self._quantize(embedding)
+        exact = self._get_fresh((namespace, qvec.tobytes()), now)
+        if exact is not None:
+            return exact
+
+        query_vec = qvec.astype(np.float32)
+        scale = float(query_vec @ query_vec)
+        matrix = self._similarity_matrix()
+        if scale <= 0 or matrix.shape[0] == 0 or matrix.shape[1] != query_vec.shape[0]:
+            return None
+        sims = (matrix @ query_vec) / scale
+        candidates = np.flatnonzero(sims >= self.threshold)
+        keys = self._matrix_keys
+        # 按相似度从高到低，取第一个同 namespace 且未过期的条目
+        for i in candidates[np.argsort(sims[candidates])[::-1]].tolist():
+            key = keys[i]
+            if key[0] != namespace:
                 continue
-            node_id = self.node_ids[idx]
-            node = self.node_lookup.get(node_id)
-            if not node:
+            cached = self._get_fresh(key, now)
+            if cached is not None:
+                return cached
+        return None
+
+    def add(self, namespace: Any, embedding: Sequence[float], response: str, question: Optional[str] = None) -> None:
+        qvec = self._quantize(embedding)
+        self._put(namespace, qvec, response, time.time())
+        if question is not None:
+            text_key = (namespace, self._normalize_text(question))
+            self._texts[text_key] = (namespace, qvec.tobytes())
+            self._texts.move_to_end(text_key)
+            while len(self._texts) > self.max_entries:
+                self._texts.popitem(last=False)
+
+    def _put(self, namespace: Any, qvec: np.ndarray, response: str, ts: float) -> None:
+        key = (namespace, qvec.tobytes())
+        self._entries[key] = (qvec, response, ts)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._matrix = None
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._texts.clear()
+        self._matrix = None
+
+    def save(self, path: Path) -> None:
+        """按 LRU 顺序把未过期条目写入 npz（量化向量、回答、namespace、写入时间）。"""
+        now = time.time()
+        items = [(k, v) for k, v in self._entries.items() if now - v[2] <= self.ttl_seconds]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            path,
+            vectors=np.stack([v[0] for _, v in items]) if items else np.empty((0, 0), dtype=np.int8),
+            responses=np.array([v[1] for _, v in items], dtype=np.str_),
+            namespaces=np.array([json.dumps(k[0], ensure_ascii=False) for k, _ in items], dtype=np.str_),
+            timestamps=np.array([v[2] for _, v in items], dtype=np.float64),
+        )
+
+    def load(self, path: Path) -> None:
+        """载入 save 写出的条目，过期条目直接丢弃。"""
+        if not path.exists():
+            return
+        with np.load(path, allow_pickle=False) as data:
+            vectors = data["vectors"]
+            responses = data["responses"].tolist()
+            namespaces = data["namespaces"].tolist()
+            timestamps = data["timestamps"].tolist()
+        now = time.time()
+        for qvec, response, ns, ts in zip(vectors, responses, namespaces, timestamps):
+            if now - ts > self.ttl_seconds:
                 continue
-            kw_norm = math.log1p(raw_score)
-            hits.append(RetrievalHit(node=node, kw_score=kw_norm, kw_raw=float(raw_score)))
+            namespace = json.loads(ns)
+            # JSON 中 tuple 会变成 list，还原后才能与 _cache_namespace() 的键相等
+            if isinstance(namespace, list):
+                namespace = tuple(namespace)
+            self._put(namespace, qvec.copy(), response, ts)
 
-        return hits
+
+# 每个字节的置位数，numpy < 2.0 没有 np.bitwise_count 时用查表计算汉明距离
+_POPCOUNT_LUT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class BinaryQuantizedIndex:
+    """向量检索的内存 ANN：先用符号位（每维 1 bit）的汉明距离粗筛，再用 int8 余弦精排。
+
+    N×D 的 float32 向量压成 N×D/8 的 uint8，粗筛只需 XOR + popcount 扫描，
+    取汉明距离最小的 top_k * oversample 个候选，再在 int8 量化向量上算余弦取前 top_k。
+    """
+
+    def __init__(self, node_ids: Sequence[str], embeddings: np.ndarray, oversample: int = 4) -> None:
+        emb = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.node_ids = list(node_ids)
+        self.oversample = max(int(oversample), 1)
+        self.bits = np.packbits(emb > 0, axis=1)
+        # 与 quantize_int8 相同：逐行 L2 归一化后按 127 缩放
+        norms = np.linalg.norm(emb, axis=1, keepdims=True)
+        unit = np.divide(emb, norms, out=np.zeros_like(emb), where=norms > 0)
+        self.codes = np.clip(np.rint(unit * 127.0), -127, 127).astype(np.int8)
+
+    @classmethod
+    def from_vector_store(cls, vector_store: Any, oversample: int = 4) -> "BinaryQuantizedIndex":
+        """从 LlamaIndex 的 SimpleVectorStore（node_id -> 向量字典）构建。"""
+        embedding_dict = getattr(getattr(vector_store, "data", None), "embedding_dict", None)
+        if not embedding_dict:
+            raise ValueError("向量库中没有可用的内存向量（仅支持 SimpleVectorStore）")
+        node_ids = list(embedding_dict)
+        embeddings = np.asarray([embedding_dict[nid] for nid in node_ids], dtype=np.float32)
+        return cls(node_ids, embeddings, oversample=oversample)
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def _hamming(self, q_bits: np.ndarray) -> np.ndarray:
+        if simsimd is not None:
+            return np.asarray(simsimd.cdist(q_bits[None, :], self.bits, metric="hamming", dtype="bin8"))[0]
+        xor = np.bitwise_xor(self.bits, q_bits)
+        if hasattr(np, "bitwise_count"):
+            return np.bitwise_count(xor).sum(axis=1, dtype=np.int32)
+        return _POPCOUNT_LUT[xor].sum(axis=1, dtype=np.int32)
+
+    def search(self, query_embedding: Sequence[float], top_k: int) -> Tuple[List[str], np.ndarray]:
+        """返回按余弦相似度降序排列的 (node_id 列表, 分数数组)。"""
+        n = len(self.node_ids)
+        k = min(top_k, n)
+        if k <= 0:
+            return [], np.empty(0, dtype=np.float32)
+        q = np.asarray(query_embedding, dtype=np.float32)
+
+        # 粗筛：汉明距离最小的 k' 个（k' >= n 时退化为全量精排）
+        n_cand = min(k * self.oversample, n)
+        if n_cand < n:
+            cand = np.argpartition(self._hamming(np.packbits(q > 0)), n_cand - 1)[:n_cand]
+        else:
+            cand = np.arange(n)
+
+        # 精排：候选的 int8 向量上计算余弦
+        scores = cosine_scores(q, self.codes[cand])
+        order = np.lexsort((cand, -scores))[:k]
+        return [self.node_ids[i] for i in cand[order].tolist()], scores[order]
+
+
+class HNSWVectorIndex:
+    """基于 hnswlib 的 HNSW 图索引，查询为亚线性的图游走；接口与 BinaryQuantizedIndex 相同。"""
+
+    def __init__(self, index: Any, node_ids: Sequence[str]) -> None:
+        self.index = index
+        self.node_ids = list(node_ids)
+
+    @classmethod
+    def build(
+        cls, node_ids: Sequence[str], embeddings: np.ndarray, M: int = 16, ef_construction: int = 200
+    ) -> "HNSWVectorIndex":
+        emb = np.ascontiguousarray(embeddings, dtype=np.float32)
+        index = hnswlib.Index(space="cosine", dim=emb.shape[1])
+        index.init_index(max_elements=max(len(emb), 1), ef_construction=ef_construction, M=M)
+        if len(emb):
+            index.add_items(emb, np.arange(len(emb)))
+        return cls(index, node_ids)
+
+    @classmethod
+    def from_vector_store(cls, vector_store: Any, **kwargs: Any) -> "HNSWVectorIndex":
+        embedding_dict = getattr(getattr(vector_store, "data", None), "embedding_dict", None)
+        if not embedding_dict:
+            raise ValueError("向量库中没有可用的内存向量（仅支持 SimpleVectorStore）")
+        node_ids = list(embedding_dict)
+        embeddings = np.asarray([embedding_dict[nid] for nid in node_ids], dtype=np.float32)
+        return cls.build(node_ids, embeddings, **kwargs)
+
+    def save(self, persist_dir: Path) -> None:
+        self.index.save_index(str(persist_dir / HNSW_INDEX_FILE))
+        with open(persist_dir / HNSW_IDS_FILE, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.index.dim, "node_ids": self.node_ids}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, persist_dir: Path) -> Optional["HNSWVectorIndex"]:
+        index_path = persist_dir / HNSW_INDEX_FILE
+        ids_path = persist_dir / HNSW_IDS_FILE
+        if not index_path.exists() or not ids_path.exists():
+            return None
+        with open(ids_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        node_ids = data["node_ids"]
+        # 余弦空间会按 dim 归一化查询向量，必须与建索引时一致
+        index = hnswlib.Index(space="cosine", dim=int(data["dim"]))
+        index.load_index(str(index_path), max_elements=max(len(node_ids), 1))
+        return cls(index, node_ids)
+
+    def set_ef(self, ef: int) -> None:
+        self.index.set_ef(ef)
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def search(self, query_embedding: Sequence[float], top_k: int) -> Tuple[List[str], np.ndarray]:
+        """返回按余弦相似度降序排列的 (node_id 列表, 分数数组)。"""
+        k = min(top_k, len(self.node_ids))
+        if k <= 0:
+            return [], np.empty(0, dtype=np.float32)
+        # ef 不能小于 k，否则 hnswlib 报错或召回不足
+        if self.index.ef < k:
+            self.index.set_ef(k)
+        labels, dists = self.index.knn_query(np.asarray(query_embedding, dtype=np.float32), k=k)
+        return [self.node_ids[i] for i in labels[0].tolist()], (1.0 - dists[0]).astype(np.float32)
+
+
+class CachedOpenAIEmbedding(OpenAIEmbedding):
+    """带查询向量缓存的 OpenAIEmbedding：进程内 LRU + 可选的 SQLite 磁盘缓存。
+
+    只缓存查询嵌入（文档嵌入在建索引时各不相同，缓存无收益）。重复提问时
+    直接返回缓存向量，省去一次服务商往返。
+    """
+
+    # 缓存中存放不可变的元组，返回给调用方的是新 list，调用方修改返回值不会污染缓存
+    _query_cache: "OrderedDict[str, Tuple[float, ...]]" = PrivateAttr(default_factory=OrderedDict)
+    _cache_lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _max_cached_queries: int = PrivateAttr(default=1024)
+    _disk_path: Optional[Path] = PrivateAttr(default=None)
+    _disk_conn: Optional[sqlite3.Connection] = PrivateAttr(default=None)
+
+    def __init__(self, cache_dir: Optional[str] = None, max_cached_queries: int = 1024, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._max_cached_queries = max_cached_queries
+        self._disk_path = Path(cache_dir) / QUERY_EMBED_CACHE_FILE if cache_dir else None
+
+    def _cache_key(self, query: str) -> str:
+        # 只折叠首尾与连续空白（不改大小写，以免影响缩写/基因名等的语义），仅格式不同的问题共用缓存
+        query = " ".join(query.split())
+        return hashlib.sha256(f"{self.model_name}\0{query}".encode("utf-8")).hexdigest()
+
+    def _disk(self) -> Optional[sqlite3.Connection]:
+        """返回（必要时创建）磁盘缓存连接；调用方需持有 _cache_lock。"""
+        if self._disk_conn is None and self._disk_path is not None:
+            self._disk_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self._disk_path), check_same_thread=False)
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB)")
+            conn.commit()
+            self._disk_conn = conn
+        return self._disk_conn
+
+    def _remember(self, key: str, embedding: Sequence[float]) -> None:
+        # 调用方需持有 _cache_lock
+        self._query_cache[key] = tuple(embedding)
+        self._query_cache.move_to_end(key)
+        while len(self._query_cache) > self._max_cached_queries:
+            self._query_cache.popitem(last=False)
+
+    def _cache_get(self, key: str) -> Optional[List[float]]:
+        with self._cache_lock:
+            cached = self._query_cache.get(key)
+            if cached is not None:
+                self._query_cache.move_to_end(key)
+                return list(cached)
+            try:
+                conn = self._disk()
+                row = conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone() if conn else None
+            except sqlite3.Error:
+                row = None
+            if row is None:
+                return None
+            embedding = np.frombuffer(row[0], dtype=np.float64).tolist()
+            self._remember(key, embedding)
+            return embedding
+
+    def _cache_put(self, key: str, embedding: List[float]) -> None:
+        with self._cache_lock:
+            self._remember(key, embedding)
+            try:
+                conn = self._disk()
+                if conn is not None:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+                        (key, np.asarray(embedding, dtype=np.float64).tobytes()),
+                    )
+                    conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        key = self._cache_key(query)
+        embedding = self._cache_get(key)
+        if embedding is None:
+            embedding = super()._get_query_embedding(query)
+            self._cache_put(key, embedding)
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        key = self._cache_key(query)
+        embedding = self._cache_get(key)
+        if embedding is None:
+            embedding = await super()._aget_query_embedding(query)
+            self._cache_put(key, embedding)
+        return embedding
+
+    def _batch_misses(
+        self, queries: List[str]
+    ) -> Tuple[List[str], Dict[str, Optional[List[float]]], List[List[Tuple[str, str]]]]:
+        """逐个查缓存，返回 (每个查询的键, 键 -> 已缓存向量或 None, 未命中的 (键, 文本) 按 embed_batch_size 分批)。"""
+        keys = [self._cache_key(q) for q in queries]
+        texts: Dict[str, str] = {}
+        for key, query in zip(keys, queries):
+            texts.setdefault(key, query)
+        found = {key: self._cache_get(key) for key in texts}
+        misses = [(key, texts[key]) for key, embedding in found.items() if embedding is None]
+        batches = [misses[i:i + self.embed_batch_size] for i in range(0, len(misses), self.embed_batch_size)]
+        return keys, found, batches
+
+    def get_query_embedding_batch(self, queries: List[str]) -> List[List[float]]:
+        """批量取查询向量：命中缓存的直接返回，未命中的（去重后）按查询模式分批嵌入并写回缓存。"""
+        keys, found, batches = self._batch_misses(queries)
+        for batch in batches:
+            embeddings = get_embeddings(
+                self._get_client(), [text for _, text in batch], engine=self._query_engine, **self.additional_kwargs
+            )
+            for (key, _), embedding in zip(batch, embeddings):
+                self._cache_put(key, embedding)
+                found[key] = embedding
+        # 重复的问题各自拿到独立的 list
+        return [list(found[key]) for key in keys]
+
+    async def aget_query_embedding_batch(self, queries: List[str]) -> List[List[float]]:
+        """get_query_embedding_batch 的异步版本。"""
+        keys, found, batches = self._batch_misses(queries)
+        for batch in batches:
+            embeddings = await aget_embeddings(
+                self._get_aclient(), [text for _, text in batch], engine=self._query_engine, **self.additional_kwargs
+            )
+            for (key, _), embedding in zip(batch, embeddings):
+                self._cache_put(key, embedding)
+                found[key] = embedding
+        return [list(found[key]) for key in keys]
 
 
 class MedicalRAGSystem:
@@ -118,6 +991,8 @@ class MedicalRAGSystem:
         embedding_model: str = "text-embedding-3-small",
         paragraph_chunk_chars: int = 1200,
         max_embed_chars: int = 6000,
+        embed_batch_size: int = 256,
+        max_context_bytes: int = 0,
     ):
         """
         初始化RAG系统
@@ -127,6 +1002,7 @@ class MedicalRAGSystem:
             persist_dir: 索引持久化目录
             model_name: LLM模型名称
             embedding_model: 嵌入模型名称
+            embed_batch_size: 建索引时每次嵌入请求携带的文本条数（可用 EMBED_BATCH_SIZE 覆盖）
         """
         # 加载环境变量（如果存在 .env 文件）
         load_dotenv()
@@ -156,18 +1032,47 @@ class MedicalRAGSystem:
 
         self.max_embed_chars = max_embed_chars
 
+        try:
+            self.embed_batch_size = max(1, int(os.getenv("EMBED_BATCH_SIZE") or embed_batch_size))
+        except ValueError:
+            self.embed_batch_size = embed_batch_size
+
+        # 拼接父块上下文时的字节预算（UTF-8），累计达到后不再追加后续父块，同时丢弃开头相同的近重复父块；
+        # 0 表示不限制（上下文与未设置预算时完全一致）
+        try:
+            self.max_context_bytes = max(0, int(os.getenv("MAX_CONTEXT_BYTES") or max_context_bytes))
+        except ValueError:
+            self.max_context_bytes = max(0, max_context_bytes)
+
+        # 文档级元信息抽取时并发的 LLM 请求数
+        try:
+            self.llm_concurrency = max(1, int(os.getenv("LLM_CONCURRENCY", "8")))
+        except ValueError:
+            self.llm_concurrency = 8
+        # 并发抽取时多个线程同时打印，加锁避免输出交错
+        self._print_lock = threading.Lock()
+        # LLM 抽取结果的磁盘缓存，首次使用时再打开（persist_dir 此时可能尚不存在）
+        self._llm_cache_conn: Optional[sqlite3.Connection] = None
+        self._llm_cache_lock = threading.Lock()
+
         # 处理API代理配置
         api_key = os.getenv("OPENAI_API_KEY") or os.getenv("LLM_API_KEY")
         api_base = os.getenv("OPENAI_BASE_URL") or os.getenv("LLM_BASE_URL")
         timeout = os.getenv("OPENAI_TIMEOUT") or os.getenv("LLM_TIMEOUT")
         timeout_value = float(timeout) if timeout else None
 
+        # reuse_client：LLM 与嵌入各自只创建一次 SDK 客户端，其内部 httpx 连接池跨请求保持
+        # keep-alive，后续查询不再重复 TLS 握手（Settings.llm / embed_model 在此设置后全程复用）
         llm_kwargs = {
             "model": self.model_name,
             "temperature": 0.1,
+            "reuse_client": True,
         }
         embed_kwargs = {
             "model": self.embedding_model,
+            # 默认批量（10）在冷构建时请求次数过多，放大批量以减少 HTTPS 往返
+            "embed_batch_size": self.embed_batch_size,
+            "reuse_client": True,
         }
 
         if api_key:
@@ -180,33 +1085,52 @@ class MedicalRAGSystem:
             llm_kwargs["timeout"] = timeout_value
             embed_kwargs["timeout"] = timeout_value
 
-        # 配置LlamaIndex全局设置
+        # 配置LlamaIndex全局设置；LLM 客户端只在这里用到，延迟导入以缩短 import rag_demo 的耗时
+        from llama_index.llms.openai import OpenAI
+
         Settings.llm = OpenAI(**llm_kwargs)
-        Settings.embed_model = OpenAIEmbedding(**embed_kwargs)
+        Settings.embed_model = CachedOpenAIEmbedding(cache_dir=self.persist_dir, **embed_kwargs)
 
         self.index = None
         self.query_engine = None
         self.vector_index = None
         self.keyword_index = None
-        self.parent_text_map = {}
+        self.parent_text_map: Mapping = {}
         self.keyword_index = None
         self.doc_metadata: Dict[str, Dict[str, Any]] = {}
+        # rerank 用到的候选节点向量缓存：node_id -> int8 量化后的嵌入
+        self._node_emb: Dict[str, np.ndarray] = {}
+        # dual_retrieve_hits 中与向量检索并行执行 BM25 的线程池，首次使用时创建
+        self._kw_executor: Optional[ThreadPoolExecutor] = None
+        # 可选的向量检索 ANN（enable_binary_ann / enable_hnsw_ann），启用后替代向量库的全量余弦扫描
+        self.ann_index: Optional[Any] = None
+        self.query_cache: Optional[SemanticQueryCache] = None
+        self._query_cache_path: Optional[Path] = None
+        self.streaming = False
+        self.similarity_top_k = 5
+        self.response_mode = "compact"
 
     def _persist_keyword_index(self):
         if not self.keyword_index:
             return
-        target = Path(self.persist_dir) / "keyword_index.json"
-        target.parent.mkdir(parents=True, exist_ok=True)
-        tokenized_docs = getattr(self.keyword_index, "tokenized_docs", [])
-        node_ids = getattr(self.keyword_index, "node_ids", [])
+        persist_dir = Path(self.persist_dir)
+        persist_dir.mkdir(parents=True, exist_ok=True)
         data = {
             "type": "bm25",
+            "backend": getattr(self.keyword_index, "backend", "sparse"),
             "token_pattern": getattr(self.keyword_index, "token_pattern", r"[a-zA-Z]{2,}"),
-            "node_ids": node_ids,
-            "tokenized_docs": tokenized_docs,
+            "boost_header": getattr(self.keyword_index, "boost_header", True),
+            "node_ids": getattr(self.keyword_index, "node_ids", []),
+            "content_digest": getattr(self.keyword_index, "content_digest", None),
         }
-        with target.open("w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False)
+        # 分词结果/得分矩阵以二进制单独保存，JSON 只保留小体积的元信息
+        self.keyword_index.save(persist_dir)
+        target = persist_dir / KEYWORD_INDEX_FILE
+        if orjson is not None:
+            target.write_bytes(orjson.dumps(data))
+        else:
+            with target.open("w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
 
     def _persist_parent_map(self):
         if not self.parent_text_map:
@@ -214,7 +1138,7 @@ class MedicalRAGSystem:
         target = Path(self.persist_dir) / "parent_text_map.json"
         target.parent.mkdir(parents=True, exist_ok=True)
         with target.open("w", encoding="utf-8") as f:
-            json.dump(self.parent_text_map, f, ensure_ascii=False)
+            json.dump(dict(self.parent_text_map), f, ensure_ascii=False)
 
     def _persist_doc_metadata(self):
         if not self.doc_metadata:
@@ -236,29 +1160,44 @@ class MedicalRAGSystem:
                 pass
         return {}
 
+    def _load_parent_map(self) -> Mapping:
+        map_path = Path(self.persist_dir) / "parent_text_map.json"
+        if map_path.exists():
+            try:
+                with map_path.open("r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    return ParentTextStore(data.items())
+            except Exception:
+                pass
+        return {}
+
     def _build_parent_nodes(self, documents: List):
         """将一个文档切分为：标题行 + 直到下一个标题前的正文，作为父节点"""
         parent_nodes: List[TextNode] = []
-        heading_re = re.compile(r"^(#{1,6})\s+(.*)$", re.MULTILINE)
 
         for doc in documents:
             text = (doc.text or "").replace("\r\n", "\n").replace("\r", "\n")
-            metadata = dict(doc.metadata or {})
+            metadata = doc.metadata or {}
             file_path = metadata.get("file_path") or metadata.get("filename") or metadata.get("file_name")
-            file_name = Path(file_path).name if file_path else metadata.get("file_name", "")
-            folder_name = Path(file_path).parent.name if file_path else "unknown_folder"
+            # 每个文档只解析一次路径
+            path = Path(file_path) if file_path else None
+            file_name = path.name if path else metadata.get("file_name", "")
+            folder_name = path.parent.name if path else "unknown_folder"
             doc_stem = Path(file_name).stem if file_name else "doc"
             doc_id = f"{folder_name}__{doc_stem}"
             base_id = f"{doc_id}"
+            # 文档级元数据模板，各父块只覆盖标题相关字段
+            base_meta = {**metadata, "section_header": "", "doc_id": doc_id, "doc_title": ""}
 
-            matches = list(heading_re.finditer(text))
+            matches = list(HEADING_RE.finditer(text))
             # 如果没有标题，就把全文当成一个父块
             if not matches:
                 node_id = f"{base_id}_h0"
                 parent_nodes.append(
                     TextNode(
                         text=text.strip(),
-                        metadata={**metadata, "section_header": "", "doc_id": doc_id, "doc_title": ""},
+                        metadata=dict(base_meta),
                         id_=node_id,
                     )
                 )
@@ -273,7 +1212,7 @@ class MedicalRAGSystem:
                     parent_nodes.append(
                         TextNode(
                             text=preface,
-                            metadata={**metadata, "section_header": "", "doc_id": doc_id, "doc_title": ""},
+                            metadata=dict(base_meta),
                             id_=node_id,
                         )
                     )
@@ -288,7 +1227,7 @@ class MedicalRAGSystem:
                 parent_nodes.append(
                     TextNode(
                         text=block,
-                        metadata={**metadata, "section_header": heading_text, "doc_id": doc_id, "doc_title": heading_text},
+                        metadata={**base_meta, "section_header": heading_text, "doc_title": heading_text},
                         id_=node_id,
                     )
                 )
@@ -297,49 +1236,7 @@ class MedicalRAGSystem:
 
     def _chunk_paragraph(self, paragraph: str) -> List[str]:
         """将段落拆分为不打断句子的子块，优先在句末边界分包"""
-        def _normalize(text: str) -> str:
-            # 统一行结束符并压缩多余空白
-            text = text.replace("\r\n", "\n").replace("\r", "\n")
-            return text.strip()
-
-        limit = max(self.paragraph_chunk_chars, 200)
-        paragraph = _normalize(paragraph)
-        if not paragraph:
-            return []
-
-        # 句子切分：兼顾中英文句号/问号/感叹号，保留分隔符
-        sentence_pattern = re.compile(r"(?<=[。！？!?.])\s+")
-        sentences = [s.strip() for s in sentence_pattern.split(paragraph) if s.strip()]
-
-        # 如果只有一条且长度已在限制内，直接返回
-        if len(sentences) == 1 and len(sentences[0]) <= limit:
-            return [sentences[0]]
-
-        chunks: List[str] = []
-        buffer = ""
-
-        for sentence in sentences:
-            # 若当前句子本身超长，单独成块以避免硬切句子
-            if len(sentence) > limit:
-                if buffer:
-                    chunks.append(buffer.strip())
-                    buffer = ""
-                chunks.append(sentence)
-                continue
-
-            # 尝试将句子放入当前缓冲
-            prospective = (buffer + " " + sentence).strip() if buffer else sentence
-            if len(prospective) <= limit:
-                buffer = prospective
-            else:
-                if buffer:
-                    chunks.append(buffer.strip())
-                buffer = sentence
-
-        if buffer:
-            chunks.append(buffer.strip())
-
-        return chunks
+        return chunk_paragraph(paragraph, max(self.paragraph_chunk_chars, 200))
 
     def _truncate_for_embedding(self, text: str) -> str:
         """限制单块文本长度，避免超出嵌入模型上下文。"""
@@ -353,7 +1250,7 @@ class MedicalRAGSystem:
         if not self.doc_metadata:
             return
         for node in parent_nodes:
-            meta = dict(node.metadata or {})
+            meta = node.metadata if node.metadata is not None else {}
             doc_id = meta.get("doc_id")
             if not doc_id:
                 continue
@@ -372,7 +1269,46 @@ class MedicalRAGSystem:
             )
             node.metadata = meta
 
+    def _llm_cache(self) -> sqlite3.Connection:
+        """返回（必要时创建）LLM 抽取缓存连接；调用方需持有 _llm_cache_lock。"""
+        if self._llm_cache_conn is None:
+            cache_path = Path(self.persist_dir) / LLM_EXTRACT_CACHE_FILE
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(cache_path), check_same_thread=False)
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT)")
+            conn.commit()
+            self._llm_cache_conn = conn
+        return self._llm_cache_conn
+
+    def _llm_cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with self._llm_cache_lock:
+                row = self._llm_cache().execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            return json.loads(row[0]) if row else None
+        except (sqlite3.Error, json.JSONDecodeError):
+            return None
+
+    def _llm_cache_put(self, key: str, value: Dict[str, Any]) -> None:
+        try:
+            with self._llm_cache_lock:
+                conn = self._llm_cache()
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False)),
+                )
+                conn.commit()
+        except sqlite3.Error:
+            pass
+
     def _llm_extract_fields(self, text: str, need_doi: bool, need_authors: bool) -> Dict[str, Any]:
+        # 论文正文在多次构建之间基本不变：相同模型、字段与正文直接复用上次的抽取结果
+        cache_key = hashlib.sha256(
+            f"{self.model_name}\0{need_doi}\0{need_authors}\0{text[:4000]}".encode("utf-8")
+        ).hexdigest()
+        cached = self._llm_cache_get(cache_key)
+        if cached is not None:
+            return cached
+
         fields = []
         if need_doi:
             fields.append("doi")
@@ -399,25 +1335,68 @@ class MedicalRAGSystem:
         try:
             resp = Settings.llm.complete(prompt)
             raw = resp.text if hasattr(resp, "text") else str(resp)
-            print(f"DEBUG LLM Output: {raw}")
-
-            match = re.search(r"\{[\s\S]*\}", raw)
-            if match:
-                raw_json = match.group(0)
-                data = json.loads(raw_json)
-                return {
+            with self._print_lock:
+                print(f"DEBUG LLM Output: {raw}")
+
+            # 从第一个 "{" 起增量解码，遇到首个完整对象即停止，不必先用正则截取整段
+            start = raw.find("{")
+            if start >= 0:
+                data, _ = JSON_DECODER.raw_decode(raw, start)
+                result = {
                     "doi": data.get("doi"),
                     "authors": data.get("authors") or [],
                 }
+                # 只缓存解析成功的结果，网络错误等失败下次仍会重试
+                self._llm_cache_put(cache_key, result)
+                return result
 
         except json.JSONDecodeError as e:
-            print(f"JSON解析失败: {e}")
+            with self._print_lock:
+                print(f"JSON解析失败: {e}")
         except Exception as e:  # noqa: BLE001
-            print(f"其他错误: {e}")
+            with self._print_lock:
+                print(f"其他错误: {e}")
 
         return {"doi": None, "authors": []}
 
 
+    def _extract_one_doc(self, doc_id: str, nodes: List[TextNode]) -> Dict[str, Any]:
+        """按父块顺序抽取单个文档的 DOI 与作者，缺项才继续调用 LLM。"""
+        doi = None
+        authors: List[str] = []
+        title = nodes[0].metadata.get("doc_title", "") if nodes else ""
+        file_path = nodes[0].metadata.get("file_path") or nodes[0].metadata.get("filename") or nodes[0].metadata.get("file_name")
+        folder_name = Path(file_path).parent.name if file_path else ""
+
+        for parent in nodes:
+            text = parent.text or ""
+            if need_doi := doi is None:
+                m = DOI_RE.search(text)
+                if m:
+                    doi = m.group(0).strip().rstrip(".,)")
+            need_authors = len(authors) == 0
+
+            if not need_doi and not need_authors:
+                break
+
+            fields = self._llm_extract_fields(text, need_doi=need_doi, need_authors=need_authors)
+            if need_doi and fields.get("doi"):
+                doi = fields["doi"].strip()
+            if need_authors and fields.get("authors"):
+                authors = [a.strip() for a in fields["authors"] if a and isinstance(a, str)]
+
+            if doi and authors:
+                break
+
+        return {
+            "doc_id": doc_id,
+            "title": title,
+            "doi": doi,
+            "authors": authors,
+            "file_path": file_path,
+            "folder": folder_name,
+        }
+
     def _extract_doc_metadata(self, parent_nodes: List[TextNode], reextract: bool = False) -> Dict[str, Dict[str, Any]]:
         """基于父块顺序调用 LLM 抽取文档级 DOI 与作者信息。"""
 
@@ -433,44 +1412,14 @@ class MedicalRAGSystem:
             doc_id = node.metadata.get("doc_id") or "unknown_doc"
             doc_groups[doc_id].append(node)
 
-        doi_pattern = re.compile(r"10\.\d{4,9}/\S+", re.IGNORECASE)
-        extracted: Dict[str, Dict[str, Any]] = {}
-
-        for doc_id, nodes in doc_groups.items():
-            doi = None
-            authors: List[str] = []
-            title = nodes[0].metadata.get("doc_title", "") if nodes else ""
-            file_path = nodes[0].metadata.get("file_path") or nodes[0].metadata.get("filename") or nodes[0].metadata.get("file_name")
-            folder_name = Path(file_path).parent.name if file_path else ""
-
-            for parent in nodes:
-                text = parent.text or ""
-                if need_doi := doi is None:
-                    m = doi_pattern.search(text)
-                    if m:
-                        doi = m.group(0).strip().rstrip(".,)")
-                need_authors = len(authors) == 0
-
-                if not need_doi and not need_authors:
-                    break
-
-                fields = self._llm_extract_fields(text, need_doi=need_doi, need_authors=need_authors)
-                if need_doi and fields.get("doi"):
-                    doi = fields["doi"].strip()
-                if need_authors and fields.get("authors"):
-                    authors = [a.strip() for a in fields["authors"] if a and isinstance(a, str)]
-
-                if doi and authors:
-                    break
-
-            extracted[doc_id] = {
-                "doc_id": doc_id,
-                "title": title,
-                "doi": doi,
-                "authors": authors,
-                "file_path": file_path,
-                "folder": folder_name,
-            }
+        # 各文档互相独立，LLM 调用以网络等待为主，按文档并发抽取
+        results: Dict[str, Dict[str, Any]] = {}
+        with ThreadPoolExecutor(max_workers=min(self.llm_concurrency, max(len(doc_groups), 1))) as ex:
+            futures = {ex.submit(self._extract_one_doc, doc_id, nodes): doc_id for doc_id, nodes in doc_groups.items()}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        # 按文档原始顺序写回，保证持久化结果稳定
+        extracted = {doc_id: results[doc_id] for doc_id in doc_groups}
 
         self.doc_metadata = extracted
         self._apply_doc_meta_to_parents(parent_nodes)
@@ -482,13 +1431,11 @@ class MedicalRAGSystem:
         doc_id = meta.get("doc_id")
         if doc_id:
             return doc_id
-        base = meta.get("parent_node_id") or node.node_id
-        doc_id = re.sub(r"_(h\d+|preface|tbl\d+|p\d+_\d+)$", "", base)
-        return doc_id
+        return _doc_id_from_node_id(meta.get("parent_node_id") or node.node_id)
 
     def _enrich_node_metadata(self, node: TextNode) -> None:
-        """为节点补充 doc 级元数据，便于检索后展示。"""
-        meta = dict(node.metadata or {})
+        """为节点补充 doc 级元数据，便于检索后展示。直接原地修改（setdefault 已补过的字段不会重复计算）。"""
+        meta = node.metadata if node.metadata is not None else {}
         doc_id = self._infer_doc_id(node)
         meta.setdefault("doc_id", doc_id)
         doc_info = self.doc_metadata.get(doc_id) if doc_id else None
@@ -498,6 +1445,9 @@ class MedicalRAGSystem:
             meta.setdefault("doc_authors", doc_info.get("authors", []))
             meta.setdefault("doc_authors_str", ", ".join(doc_info.get("authors", [])))
             meta.setdefault("doc_file_path", doc_info.get("file_path"))
+        if "doc_authors_str" not in meta and meta.get("doc_authors"):
+            # 旧索引中的节点可能只有作者列表，这里补齐拼接好的字符串供展示层直接读取
+            meta["doc_authors_str"] = ", ".join(meta["doc_authors"])
         node.metadata = meta
 
     def get_doc_info_for_node(self, node: TextNode) -> Dict[str, Any]:
@@ -506,6 +1456,10 @@ class MedicalRAGSystem:
 
     def _split_node_into_segments(self, node: TextNode) -> List[TextNode]:
         """将标题级节点细分为段落/表格等子块，并附加溯源元信息"""
+        return list(self._iter_child_segments(node))
+
+    def _iter_child_segments(self, node: TextNode) -> Iterator[TextNode]:
+        """_split_node_into_segments 的惰性版本，按顺序逐个产出子块，调用方可提前停止"""
         base_metadata = dict(node.metadata)
         header = (
             base_metadata.get("header")
@@ -524,85 +1478,35 @@ class MedicalRAGSystem:
         if source_path:
             folder_name = Path(str(source_path)).parent.name
 
-        table_pattern = re.compile(r"(<table\b[\s\S]*?</table>)", re.IGNORECASE)
-        raw_segments = table_pattern.split(node.text or "")
-
-        enhanced_nodes: List[TextNode] = []
-        paragraph_index = 0
+        # 纯文本切分在 segmenter 中完成，这里只组装元数据与 TextNode
+        limit = max(self.paragraph_chunk_chars, 200)
         segment_counter = 0
+        for chunk_text, is_table, paragraph_index, chunk_order in iter_segments(node.text or "", limit):
+            segment_counter += 1
+            metadata = dict(base_metadata)
+            metadata.update(
+                {
+                    "source_folder": folder_name,
+                    "section_header": header,
+                    "section_paragraph_index": paragraph_index,
+                    "section_paragraph_chunk": chunk_order,
+                    "section_segment_index": segment_counter,
+                    "segment_type": "table" if is_table else "text",
+                    "is_table": is_table,
+                    "parent_node_id": node.node_id,
+                }
+            )
+            node_id = (
+                f"{node.node_id}_tbl{paragraph_index}"
+                if is_table
+                else f"{node.node_id}_p{paragraph_index}_{chunk_order}"
+            )
+            yield TextNode(
+                text=self._truncate_for_embedding(chunk_text),
+                metadata=metadata,
+                id_=node_id,
+            )
 
-        for raw_segment in raw_segments:
-            if not raw_segment or not raw_segment.strip():
-                continue
-
-            is_table = bool(table_pattern.fullmatch(raw_segment.strip()))
-
-            if is_table:
-                paragraph_index += 1
-                segment_counter += 1
-                metadata = dict(base_metadata)
-                metadata.update(
-                    {
-                        "source_folder": folder_name,
-                        "section_header": header,
-                        "section_paragraph_index": paragraph_index,
-                        "section_paragraph_chunk": 1,
-                        "section_segment_index": segment_counter,
-                        "segment_type": "table",
-                        "is_table": True,
-                        "parent_node_id": node.node_id,
-                    }
-                )
-                enhanced_nodes.append(
-                    TextNode(
-                        text=self._truncate_for_embedding(raw_segment.strip()),
-                        metadata=metadata,
-                        id_=f"{node.node_id}_tbl{paragraph_index}",
-                    )
-                )
-                continue
-
-            cleaned_segment = raw_segment.replace("\r\n", "\n").replace("\r", "\n")
-            paragraphs = [
-                paragraph.strip()
-                for paragraph in re.split(r"\n\s*\n", cleaned_segment)
-                if paragraph.strip()
-            ]
-
-            if not paragraphs:
-                continue
-
-            for paragraph in paragraphs:
-                paragraph_index += 1
-                chunks = self._chunk_paragraph(paragraph)
-                if not chunks:
-                    continue
-                for chunk_order, chunk_text in enumerate(chunks, start=1):
-                    segment_counter += 1
-                    chunk_text = self._truncate_for_embedding(chunk_text)
-                    metadata = dict(base_metadata)
-                    metadata.update(
-                        {
-                            "source_folder": folder_name,
-                            "section_header": header,
-                            "section_paragraph_index": paragraph_index,
-                            "section_paragraph_chunk": chunk_order,
-                            "section_segment_index": segment_counter,
-                            "segment_type": "text",
-                            "is_table": False,
-                            "parent_node_id": node.node_id,
-                        }
-                    )
-                    enhanced_nodes.append(
-                        TextNode(
-                            text=chunk_text,
-                            metadata=metadata,
-                            id_=f"{node.node_id}_p{paragraph_index}_{chunk_order}",
-                        )
-                    )
-
-        return enhanced_nodes
-        
     def collect_doc_files(self) -> List[str]:
         """递归收集目标目录下的所有 Markdown 文件。"""
 
@@ -610,8 +1514,14 @@ class MedicalRAGSystem:
         if not base_path.exists():
             raise FileNotFoundError(f"目录不存在: {self.data_dir}")
 
-        # 递归查找所有 .md 文件（不再限定 doc.md/doc_*.md）
-        doc_files = sorted(str(p) for p in base_path.rglob("*.md") if p.is_file())
+        # 递归查找所有 .md 文件（不再限定 doc.md/doc_*.md）。
+        # os.walk 基于 scandir 单次遍历，按后缀过滤，省去 rglob 的逐项 fnmatch + stat
+        doc_files = sorted(
+            os.path.join(root, name)
+            for root, _, files in os.walk(str(base_path))
+            for name in files
+            if name.endswith(".md")
+        )
 
         print(f"找到 {len(doc_files)} 个文档文件")
         return doc_files
@@ -623,15 +1533,12 @@ class MedicalRAGSystem:
         if not doc_files:
             raise ValueError("未找到任何doc.md或doc_*.md文件")
         
-        # 使用SimpleDirectoryReader加载指定的文件
-        documents = []
-        for file_path in doc_files:
-            reader = SimpleDirectoryReader(
-                input_files=[file_path],
-                filename_as_id=True
-            )
-            docs = reader.load_data()
-            documents.extend(docs)
+        # 使用单个SimpleDirectoryReader一次加载全部文件，多文件时并行读取
+        reader = SimpleDirectoryReader(
+            input_files=doc_files,
+            filename_as_id=True
+        )
+        documents = reader.load_data(num_workers=min(8, len(doc_files)))
         
         print(f"成功加载 {len(documents)} 个文档")
         return documents
@@ -650,6 +1557,9 @@ class MedicalRAGSystem:
             build_keyword_index: 是否构建关键词检索索引（BM25）。若为 False，仅构建向量索引。
             reextract_doc_meta: 是否强制重新抽取文档级 DOI/作者元信息。
         """
+        # 索引可能重建，候选向量缓存随之失效
+        self._node_emb.clear()
+        self.ann_index = None
         # 检查是否已存在索引
         if not force_rebuild and os.path.exists(self.persist_dir):
             try:
@@ -660,12 +1570,24 @@ class MedicalRAGSystem:
                 self.index = load_index_from_storage(storage_context)
                 # 旧索引只包含向量，兼容老路径
                 self.vector_index = self.index
+                # 不需要关键词倒排时无需重新解析文档：直接复用已持久化的父块映射与文档元信息
+                if not build_keyword_index and not reextract_doc_meta:
+                    parent_map = self._load_parent_map()
+                    doc_meta = self._load_doc_metadata()
+                    if parent_map and doc_meta:
+                        self.parent_text_map = parent_map
+                        self.doc_metadata = doc_meta
+                        print("向量索引加载成功！父块映射已从磁盘加载（build_keyword_index=False）")
+                        return
                 print("向量索引加载成功！正在补建父块映射...")
 
                 # 补建父块映射、文档元信息与关键词倒排（不重算 embedding）
                 documents = self.load_documents()
                 parent_nodes = self._build_parent_nodes(documents)
-                self.parent_text_map = {node.node_id: node.text for node in parent_nodes}
+                self.parent_text_map = ParentTextStore((node.node_id, node.text) for node in parent_nodes)
+                if not (Path(self.persist_dir) / "parent_text_map.json").exists():
+                    # 旧版存储目录没有父块映射文件，补写一份供后续仅加载向量索引时复用
+                    self._persist_parent_map()
                 self._extract_doc_metadata(parent_nodes, reextract=reextract_doc_meta)
                 enhanced_nodes: List[TextNode] = []
                 for node in parent_nodes:
@@ -673,13 +1595,18 @@ class MedicalRAGSystem:
 
                 nodes = enhanced_nodes
                 if build_keyword_index:
-                    kw_file = Path(self.persist_dir) / "keyword_index.json"
+                    kw_file = Path(self.persist_dir) / KEYWORD_INDEX_FILE
                     if kw_file.exists():
                         try:
-                            with kw_file.open("r", encoding="utf-8") as f:
-                                kw_data = json.load(f)
-                            self.keyword_index = BM25KeywordIndexer.from_disk(kw_data, nodes)
+                            raw = kw_file.read_bytes()
+                            kw_data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+                            self.keyword_index = BM25KeywordIndexer.from_disk(
+                                kw_data, nodes, persist_dir=Path(self.persist_dir)
+                            )
                             print("关键词索引已从磁盘加载（BM25，本地检索）")
+                            if not self.keyword_index.loaded_from_disk:
+                                # 磁盘数据缺失或与当前后端不一致时已重建，按当前格式重新保存
+                                self._persist_keyword_index()
                         except Exception as e:
                             print(f"加载关键词索引失败，将重新构建: {e}")
                             self.keyword_index = BM25KeywordIndexer(nodes)
@@ -709,7 +1636,7 @@ class MedicalRAGSystem:
         self._extract_doc_metadata(parent_nodes, reextract=reextract_doc_meta)
 
         # 保留父节点文本用于父文档返回
-        self.parent_text_map = {node.node_id: node.text for node in parent_nodes}
+        self.parent_text_map = ParentTextStore((node.node_id, node.text) for node in parent_nodes)
 
         # 将每个标题块按段落进一步切分，并附加元信息
         enhanced_nodes: List[TextNode] = []
@@ -721,7 +1648,13 @@ class MedicalRAGSystem:
         
         # 创建向量索引
         print("正在创建向量索引...")
-        self.vector_index = VectorStoreIndex(nodes)
+        # 不在事件循环中时走异步嵌入，多个批次的请求并发发出
+        try:
+            asyncio.get_running_loop()
+            use_async = False
+        except RuntimeError:
+            use_async = True
+        self.vector_index = VectorStoreIndex(nodes, use_async=use_async, show_progress=True)
 
         # 使用并发 LLM 提取关键词，构建本地倒排索引
         if build_keyword_index:
@@ -739,21 +1672,89 @@ class MedicalRAGSystem:
         self._persist_parent_map()
         print("索引创建并保存成功！")
     
-    def create_query_engine(self, similarity_top_k: int = 5):
+    def create_query_engine(self, similarity_top_k: int = 5, streaming: bool = False):
         """
         创建查询引擎
         
         Args:
             similarity_top_k: 返回的最相似文档数量
+            streaming: 是否流式返回LLM输出（边生成边消费 token）
         """
         if self.index is None:
             raise ValueError("索引尚未创建，请先调用create_index()")
         
         self.query_engine = self.index.as_query_engine(
             similarity_top_k=similarity_top_k,
-            response_mode="compact"
+            response_mode=self.response_mode,
+            streaming=streaming,
         )
-        print(f"查询引擎已创建 (top_k={similarity_top_k})")
+        self.streaming = streaming
+        self.similarity_top_k = similarity_top_k
+        print(f"查询引擎已创建 (top_k={similarity_top_k}, streaming={streaming})")
+
+    def _cache_namespace(self) -> Tuple[str, int, str]:
+        """语义缓存命名空间：同一问题在不同模型/检索配置下的回答不互相复用。"""
+        return (self.model_name, self.similarity_top_k, self.response_mode)
+
+    def enable_query_cache(
+        self,
+        threshold: float = 0.92,
+        ttl_seconds: float = 300.0,
+        max_entries: int = 256,
+        persist: bool = False,
+    ):
+        """
+        为 query()/aquery()/query_enterprise()/aquery_enterprise() 启用语义缓存，相同或相似问题直接返回已有回答，跳过检索与 LLM 调用
+
+        Args:
+            threshold: 问题向量余弦相似度阈值
+            ttl_seconds: 缓存条目存活时间（秒）
+            max_entries: 缓存条目上限，超出后按 LRU 淘汰
+            persist: 是否将缓存保存到 persist_dir 下，供后续进程复用
+        """
+        self.query_cache = SemanticQueryCache(
+            threshold=threshold,
+            ttl_seconds=ttl_seconds,
+            max_entries=max_entries,
+        )
+        self._query_cache_path = Path(self.persist_dir) / SEMANTIC_CACHE_FILE if persist else None
+        if self._query_cache_path is not None:
+            try:
+                self.query_cache.load(self._query_cache_path)
+            except Exception as e:  # noqa: BLE001
+                print(f"加载语义缓存失败，将从空缓存开始: {e}")
+
+    def _remember_answer(
+        self,
+        question: str,
+        query_embedding: List[float],
+        answer: str,
+        namespace: Optional[Tuple[str, ...]] = None,
+    ) -> None:
+        self.query_cache.add(namespace or self._cache_namespace(), query_embedding, answer, question=question)
+        if self._query_cache_path is not None:
+            self.query_cache.save(self._query_cache_path)
+
+    def get_query_embeddings_batch(self, questions: List[str]) -> List[List[float]]:
+        """批量嵌入多个查询（多查询扩展 / 批量问答），结果顺序与输入一致。
+
+        CachedOpenAIEmbedding 下先查查询向量缓存，只有未命中的才合并为一次（按批）查询模式的服务商调用。
+        """
+        if not questions:
+            return []
+        embed_model = Settings.embed_model
+        if isinstance(embed_model, CachedOpenAIEmbedding):
+            return embed_model.get_query_embedding_batch(list(questions))
+        return [embed_model.get_query_embedding(q) for q in questions]
+
+    async def aget_query_embeddings_batch(self, questions: List[str]) -> List[List[float]]:
+        """get_query_embeddings_batch 的异步版本。"""
+        if not questions:
+            return []
+        embed_model = Settings.embed_model
+        if isinstance(embed_model, CachedOpenAIEmbedding):
+            return await embed_model.aget_query_embedding_batch(list(questions))
+        return list(await asyncio.gather(*(embed_model.aget_query_embedding(q) for q in questions)))
 
     # === 新的企业级管道：双检索 + 简单重排 ===
     def dual_retrieve_hits(
@@ -765,40 +1766,161 @@ class MedicalRAGSystem:
         alpha: float = 0.85,
         beta: float = 0.15,
         use_keyword: bool = True,
+        query_embedding: Optional[List[float]] = None,
     ) -> List[RetrievalHit]:
-        """双检索融合（加权和），返回带详细分数的命中列表。"""
+        """双检索融合（加权和），返回带详细分数的命中列表。
 
+        query_embedding 可传入预先计算（或缓存）的问题向量，避免向量检索时重复嵌入。
+        """
+
+        use_keyword = self._check_dual_retrieve_ready(use_keyword, top_k_keyword)
+
+        kw_nodes: List[RetrievalHit] = []
+        if use_keyword:
+            # BM25 为本地 CPU 计算，放到工作线程与向量检索（嵌入请求 + 相似度计算）并行
+            kw_future = self._kw_pool().submit(self.keyword_index.retrieve, question, top_k_keyword)
+            vec_nodes = self._vector_retrieve(question, top_k_vector, query_embedding)
+            kw_nodes = kw_future.result()
+        else:
+            vec_nodes = self._vector_retrieve(question, top_k_vector, query_embedding)
+
+        return self._fuse_hits(vec_nodes, kw_nodes, merge_top_k, alpha, beta)
+
+    async def adual_retrieve_hits(
+        self,
+        question: str,
+        top_k_vector: int = 20,
+        top_k_keyword: int = 20,
+        merge_top_k: int = 5,
+        alpha: float = 0.85,
+        beta: float = 0.15,
+        use_keyword: bool = True,
+        query_embedding: Optional[List[float]] = None,
+    ) -> List[RetrievalHit]:
+        """dual_retrieve_hits 的异步版本：向量检索走 aretrieve，BM25 放到线程中，两路用 gather 并发。"""
+        use_keyword = self._check_dual_retrieve_ready(use_keyword, top_k_keyword)
+        vec_coro = self._avector_retrieve(question, top_k_vector, query_embedding)
+
+        kw_nodes: List[RetrievalHit] = []
+        if use_keyword:
+            vec_nodes, kw_nodes = await asyncio.gather(
+                vec_coro,
+                asyncio.to_thread(self.keyword_index.retrieve, question, top_k_keyword),
+            )
+        else:
+            vec_nodes = await vec_coro
+
+        return self._fuse_hits(vec_nodes, kw_nodes, merge_top_k, alpha, beta)
+
+    def enable_binary_ann(self, oversample: int = 4) -> None:
+        """为向量检索启用二值量化 ANN：汉明距离粗筛 top_k * oversample 个候选，再用 int8 余弦精排。
+
+        仅支持内存向量库（SimpleVectorStore）；重建索引后需重新调用。
+        """
+        if self.vector_index is None:
+            raise ValueError("索引尚未创建，请先调用create_index()")
+        self.ann_index = BinaryQuantizedIndex.from_vector_store(self.vector_index.vector_store, oversample=oversample)
+        print(f"二值量化 ANN 已启用: {len(self.ann_index)} 个向量, oversample={oversample}")
+
+    def enable_hnsw_ann(self, ef: int = 64, M: int = 16, ef_construction: int = 200, rebuild: bool = False) -> None:
+        """为向量检索启用 HNSW 图索引（需安装 hnswlib），持久化在 persist_dir 下，节点集合不变时直接加载。
+
+        ef 越大召回越高、查询越慢；查询时会自动保证 ef >= top_k。
+        """
+        if hnswlib is None:
+            raise ImportError("启用 HNSW 需要安装 hnswlib: pip install hnswlib")
+        if self.vector_index is None:
+            raise ValueError("索引尚未创建，请先调用create_index()")
+        persist_dir = Path(self.persist_dir)
+        embedding_dict = getattr(getattr(self.vector_index.vector_store, "data", None), "embedding_dict", None) or {}
+        ann = None if rebuild else HNSWVectorIndex.load(persist_dir)
+        if ann is not None and set(ann.node_ids) != set(embedding_dict):
+            print("HNSW 索引与当前向量库不一致，将重新构建...")
+            ann = None
+        if ann is None:
+            ann = HNSWVectorIndex.from_vector_store(self.vector_index.vector_store, M=M, ef_construction=ef_construction)
+            persist_dir.mkdir(parents=True, exist_ok=True)
+            ann.save(persist_dir)
+        ann.set_ef(ef)
+        self.ann_index = ann
+        print(f"HNSW 向量索引已启用: {len(ann)} 个向量, ef={ef}")
+
+    def _vector_retrieve(
+        self, question: str, top_k: int, query_embedding: Optional[List[float]] = None
+    ) -> List[NodeWithScore]:
+        if self.ann_index is None:
+            retriever = self.vector_index.as_retriever(similarity_top_k=top_k)
+            return retriever.retrieve(QueryBundle(query_str=question, embedding=query_embedding))
+        if query_embedding is None:
+            query_embedding = Settings.embed_model.get_query_embedding(question)
+        return self._ann_search(query_embedding, top_k)
+
+    async def _avector_retrieve(
+        self, question: str, top_k: int, query_embedding: Optional[List[float]] = None
+    ) -> List[NodeWithScore]:
+        if self.ann_index is None:
+            retriever = self.vector_index.as_retriever(similarity_top_k=top_k)
+            return await retriever.aretrieve(QueryBundle(query_str=question, embedding=query_embedding))
+        if query_embedding is None:
+            query_embedding = await Settings.embed_model.aget_query_embedding(question)
+        return self._ann_search(query_embedding, top_k)
+
+    def _ann_search(self, query_embedding: List[float], top_k: int) -> List[NodeWithScore]:
+        node_ids, scores = self.ann_index.search(query_embedding, top_k)
+        nodes = self.vector_index.docstore.get_nodes(node_ids)
+        return [NodeWithScore(node=node, score=float(score)) for node, score in zip(nodes, scores.tolist())]
+
+    def _check_dual_retrieve_ready(self, use_keyword: bool, top_k_keyword: int) -> bool:
+        """校验索引状态，返回是否需要执行关键词检索。"""
         if self.vector_index is None:
             raise ValueError("索引尚未创建，请先调用create_index()")
         if use_keyword and self.keyword_index is None:
             raise ValueError("关键词索引尚未创建，请先调用create_index(build_keyword_index=True)")
+        return use_keyword and top_k_keyword > 0
 
-        vec_nodes = self.vector_index.as_retriever(similarity_top_k=top_k_vector).retrieve(question)
-        kw_nodes: List[RetrievalHit] = []
-        if use_keyword and top_k_keyword > 0:
-            kw_nodes = self.keyword_index.retrieve(question, top_k=top_k_keyword)
-
-        merged: Dict[str, RetrievalHit] = {}
-
-        for n in vec_nodes:
-            nid = n.node.node_id
-            hit = merged.get(nid) or RetrievalHit(node=n.node)
-            hit.vec_score = max(hit.vec_score, n.score or 0.0)
-            merged[nid] = hit
-
-        for n in kw_nodes:
-            nid = n.node.node_id
-            hit = merged.get(nid) or RetrievalHit(node=n.node)
-            hit.kw_score = max(hit.kw_score, n.kw_score)
-            hit.kw_raw = max(hit.kw_raw, n.kw_raw)
-            merged[nid] = hit
-
-        # 计算融合分数
-        for hit in merged.values():
-            self._enrich_node_metadata(hit.node)
-            hit.score = alpha * hit.vec_score + beta * hit.kw_score
-
-        sorted_hits = sorted(merged.values(), key=lambda x: x.score, reverse=True)[:merge_top_k]
+    def _kw_pool(self) -> ThreadPoolExecutor:
+        if self._kw_executor is None:
+            self._kw_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25")
+        return self._kw_executor
+
+    def _fuse_hits(
+        self,
+        vec_nodes: List[Any],
+        kw_nodes: List[RetrievalHit],
+        merge_top_k: int,
+        alpha: float,
+        beta: float,
+    ) -> List[RetrievalHit]:
+        """按加权和融合两路检索结果，返回前 merge_top_k 个命中。"""
+        # 两路候选按 node_id 去重后在 numpy 中取各路最大分并加权融合
+        cand_nodes = [n.node for n in vec_nodes] + [h.node for h in kw_nodes]
+        if not cand_nodes:
+            return []
+        n_vec = len(vec_nodes)
+        uids, first_idx, inv = np.unique(
+            [node.node_id for node in cand_nodes], return_index=True, return_inverse=True
+        )
+        inv = inv.reshape(-1)
+        vec = np.zeros(len(uids))
+        kw = np.zeros(len(uids))
+        kw_raw = np.zeros(len(uids))
+        np.maximum.at(vec, inv[:n_vec], [n.score or 0.0 for n in vec_nodes])
+        np.maximum.at(kw, inv[n_vec:], [h.kw_score for h in kw_nodes])
+        np.maximum.at(kw_raw, inv[n_vec:], [h.kw_raw for h in kw_nodes])
+        fused = alpha * vec + beta * kw
+
+        # 分数降序，同分按候选首次出现的顺序（向量路在前）
+        order = np.lexsort((first_idx, -fused))[:merge_top_k]
+        sorted_hits: List[RetrievalHit] = []
+        for u in order.tolist():
+            node = cand_nodes[first_idx[u]]
+            self._enrich_node_metadata(node)
+            hit = RetrievalHit(node=node, vec_score=float(vec[u]), kw_score=float(kw[u]), kw_raw=float(kw_raw[u]))
+            hit.score = float(fused[u])
+            # 仅为最终返回的命中解析父块原文
+            pid = (node.metadata or {}).get("parent_node_id") or node.node_id
+            hit.parent_text = self.parent_text_map.get(pid, node.text or "")
+            sorted_hits.append(hit)
         return sorted_hits
 
     def dual_retrieve(self, question: str, top_k_vector: int = 20, top_k_keyword: int = 20, merge_top_k: int = 5):
@@ -810,50 +1932,211 @@ class MedicalRAGSystem:
         )
         return [h.node for h in hits]
 
+    def _candidate_embeddings(self, nodes: List[TextNode]) -> np.ndarray:
+        """返回候选节点的 (N, D) int8 向量矩阵：优先取向量库中已存的嵌入，缺失的才批量补算，量化后按 node_id 缓存。"""
+        vector_store = getattr(self.vector_index, "vector_store", None)
+        missing: List[TextNode] = []
+        for node in nodes:
+            if node.node_id in self._node_emb:
+                continue
+            emb = node.embedding
+            if emb is None and vector_store is not None and hasattr(vector_store, "get"):
+                try:
+                    emb = vector_store.get(node.node_id)
+                except (KeyError, NotImplementedError):
+                    emb = None
+            if emb is None:
+                missing.append(node)
+            else:
+                self._node_emb[node.node_id] = quantize_int8(emb)
+        if missing:
+            embs = Settings.embed_model.get_text_embedding_batch([n.get_content() for n in missing])
+            for node, emb in zip(missing, embs):
+                self._node_emb[node.node_id] = quantize_int8(emb)
+        return np.stack([self._node_emb[n.node_id] for n in nodes])
+
     def rerank(self, question: str, nodes: List[TextNode], top_k: int = 5) -> List[TextNode]:
-        # 简单重排：再次用向量检索打分；可后续换成跨编码器
+        # 简单重排：只对候选节点按问题向量的余弦相似度重新打分，不再跑一遍全库检索；可后续换成跨编码器
         if not nodes:
             return []
-        retriever = self.vector_index.as_retriever(similarity_top_k=max(top_k, len(nodes)))
-        rescored = retriever._retrieve(query=question, nodes=nodes) if hasattr(retriever, "_retrieve") else []
-        if rescored:
-            rescored = sorted(rescored, key=lambda x: x.score or 0, reverse=True)[:top_k]
-            return [r.node for r in rescored]
-        return nodes[:top_k]
+        q_emb = Settings.embed_model.get_query_embedding(question)
+        # 缓存中为 int8 量化向量；余弦只看方向，可直接在量化向量上计算
+        scores = cosine_scores(q_emb, self._candidate_embeddings(nodes))
+        # 分数降序，同分时保持候选原有顺序
+        top = np.lexsort((np.arange(len(nodes)), -scores))[: max(top_k, 0)]
+        return [nodes[i] for i in top.tolist()]
 
     def build_context_from_parents(self, nodes: List[TextNode]) -> str:
-        seen = set()
-        parts = []
-        for n in nodes:
-            pid = n.metadata.get("parent_node_id") or n.metadata.get("node_id")
-            if pid and pid in seen:
-                continue
-            seen.add(pid)
-            parent_text = self.parent_text_map.get(pid, "")
-            if parent_text:
-                parts.append(parent_text)
+        return _join_bytes(self._context_parts(nodes), CONTEXT_SEP).decode("utf-8")
+
+    def _context_parts(self, nodes: List[TextNode]) -> List[Any]:
+        """按父块去重后各段上下文的 UTF-8 字节（bytes 或 memoryview），顺序与首次出现一致。"""
+        if not nodes:
+            return []
+        # 按父块 id 去重并保持首次出现的顺序；无父块 id 的节点各自保留
+        pids = [n.metadata.get("parent_node_id") or n.metadata.get("node_id") for n in nodes]
+        store = self.parent_text_map if isinstance(self.parent_text_map, ParentTextStore) else None
+        if store is not None:
+            # 字符串 id 只在这里查一次行号，之后去重与取文本都在 int32 行号上进行；
+            # 不在映射中的父块 id 按 id 分配共用的负数键（同一父块的子块仍去重），无父块 id 的节点各用一个负数键
+            rows = store.rows_of(pids)
+            keys = rows.copy()
+            unknown: Dict[str, int] = {}
+            next_key = -1
+            for i in np.flatnonzero(rows < 0).tolist():
+                pid = pids[i]
+                if pid and pid in unknown:
+                    keys[i] = unknown[pid]
+                    continue
+                keys[i] = next_key
+                if pid:
+                    unknown[pid] = next_key
+                next_key -= 1
+        else:
+            rows = None
+            keys = [pid if pid else f"\0{i}" for i, pid in enumerate(pids)]
+        _, first_idx = np.unique(keys, return_index=True)
+        # 收集各段的 UTF-8 字节（ParentTextStore 直接给出 blob 视图），
+        # 由调用方写入按总长预分配的 bytearray，最后只 decode 一次
+        parts: List[Any] = []
+        # 设置了上下文预算时，不同父块 id 但开头相同的近重复文本（如重复导入的同一篇文档）只保留首个：
+        # 按前 200 字节的 64 位摘要判重；未设置预算时不做此判重，以免误删开头相同的不同父块
+        seen_sigs: Set[bytes] = set()
+        budget = self.max_context_bytes
+        used = 0
+        for i in np.sort(first_idx).tolist():
+            pid = pids[i]
+            if rows is not None:
+                data = store.view_at(int(rows[i])) if rows[i] >= 0 else None
             else:
-                parts.append(n.text)
-        return "\n\n".join(parts)
-
-    def query_enterprise(self, question: str) -> str:
-        """双路检索（无重排）+父文档聚合的回答"""
-        hits = self.dual_retrieve_hits(question, top_k_vector=20, top_k_keyword=20, merge_top_k=5)
-        context = self.build_context_from_parents([h.node for h in hits])
-        prompt = (
-            "你是医学论文助手。请基于下列上下文回答用户问题，"
-            "如果无法确定答案请说明未知。\n\n"
-            f"上下文:\n{context}\n\n问题: {question}\n回答:"
-        )
-        response = Settings.llm.complete(prompt)
-        return response.text if hasattr(response, "text") else str(response)
+                text = self.parent_text_map.get(pid, "") if pid else ""
+                data = text.encode("utf-8") if text else None
+            if not data:
+                data = (nodes[i].text or "").encode("utf-8")
+            if budget:
+                sig = hashlib.blake2b(data[:200], digest_size=8).digest()
+                if sig in seen_sigs:
+                    continue
+                seen_sigs.add(sig)
+            parts.append(data)
+            used += len(data)
+            if budget and used >= budget:
+                break
+        return parts
+
+    def query_enterprise(self, question: str, stream: Optional[bool] = None) -> str:
+        """双路检索（无重排）+父文档聚合的回答；启用 enable_query_cache 后相同/相似问题直接复用回答
+
+        stream 为 True 时用 stream_complete 边生成边输出到 stdout（默认跟随 create_query_engine 的 streaming）。
+        """
+        namespace = ("enterprise", self.model_name)
+        if self.query_cache is not None:
+            cached = self.query_cache.lookup_text(namespace, question)
+            if cached is not None:
+                return cached
+
+        # BM25 只依赖问题文本：先提交到线程池，与问题嵌入、语义缓存查找和向量检索重叠执行
+        # （语义缓存命中时这次 BM25 结果被丢弃，代价只是几毫秒的本地计算）
+        kw_future = None
+        if self._check_dual_retrieve_ready(True, ENTERPRISE_TOP_K_KEYWORD):
+            kw_future = self._kw_pool().submit(self.keyword_index.retrieve, question, ENTERPRISE_TOP_K_KEYWORD)
+
+        try:
+            query_embedding: Optional[List[float]] = None
+            if self.query_cache is not None:
+                # 问题向量同时用于语义查找与后续向量检索，只嵌入一次
+                query_embedding = Settings.embed_model.get_query_embedding(question)
+                cached = self.query_cache.lookup(namespace, query_embedding)
+                if cached is not None:
+                    return cached
+
+            vec_nodes = self._vector_retrieve(question, ENTERPRISE_TOP_K_VECTOR, query_embedding)
+            kw_nodes = kw_future.result() if kw_future is not None else []
+        finally:
+            # 语义缓存命中或向量检索出错时 BM25 结果用不到：尚未开始的任务直接取消
+            if kw_future is not None:
+                kw_future.cancel()
+        hits = self._fuse_hits(vec_nodes, kw_nodes, ENTERPRISE_MERGE_TOP_K, ENTERPRISE_ALPHA, ENTERPRISE_BETA)
+
+        prompt = self._enterprise_prompt(question, hits)
+        if self.streaming if stream is None else stream:
+            tokens: List[str] = []
+            for chunk in Settings.llm.stream_complete(prompt):
+                tokens.append(chunk.delta or "")
+                print(chunk.delta or "", end="", flush=True)
+            print()
+            answer = "".join(tokens)
+        else:
+            response = Settings.llm.complete(prompt)
+            answer = response.text if hasattr(response, "text") else str(response)
+        if self.query_cache is not None:
+            self._remember_answer(question, query_embedding, answer, namespace=namespace)
+        return answer
+
+    async def aquery_enterprise(self, question: str, stream: Optional[bool] = None) -> str:
+        """query_enterprise 的异步版本：BM25 在线程中与问题嵌入、向量检索（aretrieve）并发，LLM 走 acomplete / astream_complete。"""
+        use_stream = self.streaming if stream is None else stream
+        namespace = ("enterprise", self.model_name)
+        if self.query_cache is not None:
+            cached = self.query_cache.lookup_text(namespace, question)
+            if cached is not None:
+                return cached
+
+        kw_task = None
+        if self._check_dual_retrieve_ready(True, ENTERPRISE_TOP_K_KEYWORD):
+            kw_task = asyncio.ensure_future(
+                asyncio.to_thread(self.keyword_index.retrieve, question, ENTERPRISE_TOP_K_KEYWORD)
+            )
+
+        try:
+            query_embedding: Optional[List[float]] = None
+            if self.query_cache is not None:
+                query_embedding = await Settings.embed_model.aget_query_embedding(question)
+                cached = self.query_cache.lookup(namespace, query_embedding)
+                if cached is not None:
+                    return cached
+
+            vec_nodes = await self._avector_retrieve(question, ENTERPRISE_TOP_K_VECTOR, query_embedding)
+            kw_nodes = await kw_task if kw_task is not None else []
+        finally:
+            # 语义缓存命中或向量检索出错时 BM25 结果用不到：取消任务，已结束的取回其异常，不留悬空的 Task
+            if kw_task is not None:
+                if not kw_task.done():
+                    kw_task.cancel()
+                elif not kw_task.cancelled():
+                    kw_task.exception()
+        hits = self._fuse_hits(vec_nodes, kw_nodes, ENTERPRISE_MERGE_TOP_K, ENTERPRISE_ALPHA, ENTERPRISE_BETA)
+
+        prompt = self._enterprise_prompt(question, hits)
+        if use_stream:
+            tokens: List[str] = []
+            async for chunk in await Settings.llm.astream_complete(prompt):
+                tokens.append(chunk.delta or "")
+                print(chunk.delta or "", end="", flush=True)
+            print()
+            answer = "".join(tokens)
+        else:
+            response = await Settings.llm.acomplete(prompt)
+            answer = response.text if hasattr(response, "text") else str(response)
+        if self.query_cache is not None:
+            self._remember_answer(question, query_embedding, answer, namespace=namespace)
+        return answer
+
+    def _enterprise_prompt(self, question: str, hits: List[RetrievalHit]) -> str:
+        # 变化最少的部分在前（固定指令 → 上下文 → 问题），重复问题时整段前缀都可命中服务端缓存；
+        # 模板片段与上下文都已是字节，整条提示词一次写入 bytearray 后只 decode 一次
+        context = _join_bytes(self._context_parts([h.node for h in hits]), CONTEXT_SEP)
+        return _join_bytes(
+            [ENTERPRISE_PROMPT_HEAD, context, ENTERPRISE_PROMPT_MID, question.encode("utf-8"), ENTERPRISE_PROMPT_TAIL]
+        ).decode("utf-8")
     
-    def query(self, question: str) -> str:
+    def query(self, question: str, query_embedding: Optional[List[float]] = None) -> str:
         """
         查询RAG系统
         
         Args:
             question: 用户问题
+            query_embedding: 预先（批量）计算好的问题向量，可选
             
         Returns:
             系统回答
@@ -863,21 +2146,129 @@ class MedicalRAGSystem:
         
         print(f"\n问题: {question}")
         print("-" * 80)
-        
-        response = self.query_engine.query(question)
-        
-        print(f"回答: {response}")
+
+        if self.query_cache is not None:
+            # 先按问题文本精确命中（无需嵌入），未命中再按问题向量做语义查找
+            cached = self.query_cache.lookup_text(self._cache_namespace(), question)
+            if cached is None:
+                if query_embedding is None:
+                    query_embedding = Settings.embed_model.get_query_embedding(question)
+                cached = self.query_cache.lookup(self._cache_namespace(), query_embedding)
+            if cached is not None:
+                print(f"回答（语义缓存命中）: {cached}")
+                print("-" * 80)
+                return cached
+
+        # 已计算的问题向量随 QueryBundle 传入，检索时不再重复嵌入
+        response = self.query_engine.query(QueryBundle(query_str=question, embedding=query_embedding))
+
+        if self.streaming:
+            print("回答: ", end="", flush=True)
+            answer = self._drain_stream(response, echo=True)
+        else:
+            answer = str(response)
+            print(f"回答: {answer}")
         print("-" * 80)
+        self._print_sources(response)
+
+        if self.query_cache is not None:
+            self._remember_answer(question, query_embedding, answer)
+        return answer
+
+    async def aquery(self, question: str, query_embedding: Optional[List[float]] = None) -> str:
+        """
+        异步查询RAG系统，可与其他查询并发执行（转发到 query_engine.aquery）
         
-        # 显示来源文档
+        Args:
+            question: 用户问题
+            query_embedding: 预先（批量）计算好的问题向量，可选
+            
+        Returns:
+            系统回答
+        """
+        if self.query_engine is None:
+            raise ValueError("查询引擎尚未创建，请先调用create_query_engine()")
+
+        if self.query_cache is not None:
+            cached = self.query_cache.lookup_text(self._cache_namespace(), question)
+            if cached is None:
+                if query_embedding is None:
+                    query_embedding = await Settings.embed_model.aget_query_embedding(question)
+                cached = self.query_cache.lookup(self._cache_namespace(), query_embedding)
+            if cached is not None:
+                print(f"\n问题: {question}")
+                print("-" * 80)
+                print(f"回答（语义缓存命中）: {cached}")
+                print("-" * 80)
+                return cached
+
+        query_bundle = QueryBundle(query_str=question, embedding=query_embedding)
+        if self.streaming:
+            # 流式 token 生成器是同步的：放到工作线程中边生成边消费，不阻塞事件循环
+            response, answer = await asyncio.to_thread(self._query_and_drain, query_bundle)
+        else:
+            response = await self.query_engine.aquery(query_bundle)
+            answer = str(response)
+
+        # 完成后一次性输出，避免并发查询的打印相互穿插
+        print(f"\n问题: {question}")
+        print("-" * 80)
+        print(f"回答: {answer}")
+        print("-" * 80)
+        self._print_sources(response)
+
+        if self.query_cache is not None:
+            self._remember_answer(question, query_embedding, answer)
+        return answer
+
+    def _query_and_drain(self, query_bundle: QueryBundle):
+        response = self.query_engine.query(query_bundle)
+        return response, self._drain_stream(response, echo=False)
+
+    async def aquery_batch(self, questions: List[str], max_concurrency: Optional[int] = None) -> List[str]:
+        """批量问答：所有问题的向量在一次 embedding 调用中取得，各问题的检索与 LLM 调用并发执行。
+
+        max_concurrency 限制同时在途的查询数（默认 llm_concurrency），返回顺序与输入一致。
+        """
+        if not questions:
+            return []
+        embeddings = await self.aget_query_embeddings_batch(questions)
+        semaphore = asyncio.Semaphore(max_concurrency or self.llm_concurrency)
+
+        async def run_one(question: str, embedding: List[float]) -> str:
+            async with semaphore:
+                return await self.aquery(question, query_embedding=embedding)
+
+        return list(await asyncio.gather(*(run_one(q, e) for q, e in zip(questions, embeddings))))
+
+    def query_batch(self, questions: List[str], max_concurrency: Optional[int] = None) -> List[str]:
+        """aquery_batch 的同步入口（不可在已运行的事件循环中调用）。"""
+        return asyncio.run(self.aquery_batch(questions, max_concurrency=max_concurrency))
+
+    @staticmethod
+    def _drain_stream(response, echo: bool) -> str:
+        """逐个消费流式响应的 token，返回完整回答"""
+        tokens: List[str] = []
+        for token in response.response_gen:
+            tokens.append(token)
+            if echo:
+                print(token, end="", flush=True)
+        if echo:
+            print()
+        answer = "".join(tokens)
+        # response_gen 已耗尽，回填文本以便 str(response) 仍可用
+        response.response_txt = answer
+        return answer
+
+    @staticmethod
+    def _print_sources(response) -> None:
+        """显示来源文档"""
         if hasattr(response, 'source_nodes'):
             print(f"\n参考了 {len(response.source_nodes)} 个文档片段:")
             for i, node in enumerate(response.source_nodes, 1):
                 score = node.score if hasattr(node, 'score') else 'N/A'
                 file_name = node.node.metadata.get('file_name', 'Unknown')
                 print(f"  {i}. {file_name} (相似度: {score:.4f})" if isinstance(score, float) else f"  {i}. {file_name}")
-        
-        return str(response)
     
     def chat(self):
         """交互式聊天模式"""
@@ -937,9 +2328,9 @@ def main():
         "Tell me about myocardial injury after non-cardiac surgery (MINS)."
     ]
     
-    for question in example_questions:
-        rag_system.query(question)
-        print("\n")
+    # 一次批量嵌入 + 并发检索与生成（各问题的回答在完成时输出）
+    rag_system.query_batch(example_questions)
+    print("\n")
     
     # 启动交互模式（可选）
     # rag_system.chat()
@@ -0,0 +1,77 @@
+"""
+父块 → 子块的纯文本切分流程（表格 → 段落 → 句子打包），建索引时对每个父块调用。
+
+与 formatters.py 相同，本模块只依赖标准库且注解完整，可选地用 mypyc 编译为 C 扩展：
+    mypyc segmenter.py
+编译产物（segmenter.*.so）与源文件同目录时会被优先导入，调用方无需改动。
+TextNode 与元数据的组装留在 rag_demo 中，这里只处理字符串。
+"""
+
+import re
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Iterator, List, Tuple
+
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[。！？!?.])\s+")
+TABLE_RE = re.compile(r"(<table\b[\s\S]*?</table>)", re.IGNORECASE)
+PARAGRAPH_SPLIT_RE = re.compile(r"\n\s*\n")
+
+
+def _normalize_newlines(text: str) -> str:
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def chunk_paragraph(paragraph: str, limit: int) -> List[str]:
+    """将段落拆分为不打断句子的子块，每块用空格拼接且长度不超过 limit（超长单句单独成块）。"""
+    paragraph = _normalize_newlines(paragraph).strip()
+    if not paragraph:
+        return []
+
+    # 句子切分：兼顾中英文句号/问号/感叹号，保留分隔符
+    sentences: List[str] = [s.strip() for s in SENTENCE_SPLIT_RE.split(paragraph) if s.strip()]
+    n: int = len(sentences)
+
+    # 如果只有一条且长度已在限制内，直接返回
+    if n == 1 and len(sentences[0]) <= limit:
+        return [sentences[0]]
+
+    # 前缀和：cum[j] 为前 j 句长度（各加 1 个分隔空格）之和，
+    # 句子 [a, b) 用空格拼接后的长度即 cum[b] - cum[a] - 1
+    cum: List[int] = list(accumulate((len(s) + 1 for s in sentences), initial=0))
+
+    chunks: List[str] = []
+    start: int = 0
+    while start < n:
+        # 贪心能装下的最远终点；句子本身超长时 end == start，单独成块以避免硬切句子
+        end: int = bisect_right(cum, cum[start] + limit + 1) - 1
+        if end <= start:
+            end = start + 1
+        chunks.append(" ".join(sentences[start:end]))
+        start = end
+    return chunks
+
+
+def iter_segments(text: str, limit: int) -> Iterator[Tuple[str, bool, int, int]]:
+    """按顺序产出 (子块文本, 是否表格, 段落序号, 段内块序号)；表格整体成块，段内块序号恒为 1。"""
+    paragraph_index: int = 0
+    for raw_segment in TABLE_RE.split(text):
+        if not raw_segment:
+            continue
+        stripped: str = raw_segment.strip()
+        if not stripped:
+            continue
+
+        if TABLE_RE.fullmatch(stripped):
+            paragraph_index += 1
+            yield stripped, True, paragraph_index, 1
+            continue
+
+        for paragraph in PARAGRAPH_SPLIT_RE.split(_normalize_newlines(raw_segment)):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            paragraph_index += 1
+            chunk_order: int = 0
+            for chunk_text in chunk_paragraph(paragraph, limit):
+                chunk_order += 1
+                yield chunk_text, False, paragraph_index, chunk_order
@@ -2,26 +2,29 @@
 测试脚本 - 验证系统是否正确安装和配置
 """
 
+import io
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 
 
-def check_python_version():
+def check_python_version(log=print):
     """检查Python版本"""
-    print("检查Python版本...")
+    log("检查Python版本...")
     version = sys.version_info
     if version.major < 3 or (version.major == 3 and version.minor < 9):
-        print(f"  ❌ Python版本过低: {version.major}.{version.minor}")
-        print(f"  需要Python 3.9或更高版本")
+        log(f"  ❌ Python版本过低: {version.major}.{version.minor}")
+        log(f"  需要Python 3.9或更高版本")
         return False
-    print(f"  ✓ Python {version.major}.{version.minor}.{version.micro}")
+    log(f"  ✓ Python {version.major}.{version.minor}.{version.micro}")
     return True
 
 
-def check_dependencies():
+def check_dependencies(log=print):
     """检查依赖包"""
-    print("\n检查依赖包...")
+    log("\n检查依赖包...")
     
     required_packages = [
         "llama_index",
@@ -33,100 +36,107 @@ def check_dependencies():
     for package in required_packages:
         try:
             __import__(package.replace("-", "_"))
-            print(f"  ✓ {package}")
+            log(f"  ✓ {package}")
         except ImportError:
-            print(f"  ❌ {package} 未安装")
+            log(f"  ❌ {package} 未安装")
             missing.append(package)
     
     if missing:
-        print(f"\n请运行以下命令安装缺失的包:")
-        print(f"  pip install -r requirements.txt")
+        log(f"\n请运行以下命令安装缺失的包:")
+        log(f"  pip install -r requirements.txt")
         return False
     
     return True
 
 
-def check_env_file():
+def check_env_file(log=print):
     """检查环境变量配置"""
-    print("\n检查环境变量配置...")
+    log("\n检查环境变量配置...")
     
     if not Path(".env").exists():
-        print("  ❌ .env文件不存在")
-        print("  请复制.env.example为.env并配置API密钥")
+        log("  ❌ .env文件不存在")
+        log("  请复制.env.example为.env并配置API密钥")
         return False
     
-    print("  ✓ .env文件存在")
+    log("  ✓ .env文件存在")
     
     from dotenv import load_dotenv
     load_dotenv()
     
     if not os.getenv("OPENAI_API_KEY"):
-        print("  ❌ OPENAI_API_KEY未设置")
-        print("  请在.env文件中设置你的OpenAI API密钥")
+        log("  ❌ OPENAI_API_KEY未设置")
+        log("  请在.env文件中设置你的OpenAI API密钥")
         return False
     
     api_key = os.getenv("OPENAI_API_KEY")
     if api_key.startswith("sk-") and len(api_key) > 20:
-        print(f"  ✓ OPENAI_API_KEY已配置 (sk-...{api_key[-4:]})")
+        log(f"  ✓ OPENAI_API_KEY已配置 (sk-...{api_key[-4:]})")
     else:
-        print("  ⚠ OPENAI_API_KEY格式可能不正确")
+        log("  ⚠ OPENAI_API_KEY格式可能不正确")
         return False
     
     return True
 
 
-def check_data_directory():
+def check_data_directory(log=print):
     """检查数据目录"""
-    print("\n检查数据目录...")
+    log("\n检查数据目录...")
     
     data_dir = Path("Volume 399, Issue 10337")
     
     if not data_dir.exists():
-        print(f"  ❌ 数据目录不存在: {data_dir}")
+        log(f"  ❌ 数据目录不存在: {data_dir}")
         return False
     
-    print(f"  ✓ 数据目录存在: {data_dir}")
+    log(f"  ✓ 数据目录存在: {data_dir}")
     
     # 检查是否有子文件夹和文档
-    subfolders = [f for f in data_dir.iterdir() if f.is_dir()]
+    # os.scandir 的 DirEntry 自带文件类型，不必像 iterdir/glob 那样为每项构造 Path 并 stat
+    with os.scandir(data_dir) as entries:
+        subfolders = [entry.path for entry in entries if entry.is_dir()]
     if not subfolders:
-        print("  ❌ 数据目录中没有子文件夹")
+        log("  ❌ 数据目录中没有子文件夹")
         return False
     
-    print(f"  ✓ 找到 {len(subfolders)} 个子文件夹")
+    log(f"  ✓ 找到 {len(subfolders)} 个子文件夹")
     
     primary_docs = []
     fallback_docs = []
     for subfolder in subfolders:
-        doc_md = subfolder / "doc.md"
-        if doc_md.exists():
-            primary_docs.append(doc_md)
+        # 每个子文件夹只列一次目录，同时判断 doc.md 与 doc_*.md
+        with os.scandir(subfolder) as entries:
+            names = [entry.name for entry in entries if entry.is_file()]
+        if "doc.md" in names:
+            primary_docs.append(os.path.join(subfolder, "doc.md"))
         else:
-            alt_docs = list(subfolder.glob("doc_*.md"))
-            fallback_docs.extend(alt_docs)
+            fallback_docs.extend(
+                os.path.join(subfolder, name)
+                for name in names
+                if name.startswith("doc_") and name.endswith(".md")
+            )
     
     if not primary_docs and not fallback_docs:
-        print("  ❌ 未找到任何doc.md或doc_*.md文件")
+        log("  ❌ 未找到任何doc.md或doc_*.md文件")
         return False
     
     if primary_docs:
-        print(f"  ✓ 找到 {len(primary_docs)} 个doc.md文件")
+        log(f"  ✓ 找到 {len(primary_docs)} 个doc.md文件")
     if fallback_docs:
-        print(f"  ⚠ 未提供doc.md的文件夹中共找到 {len(fallback_docs)} 个doc_*.md文件")
+        log(f"  ⚠ 未提供doc.md的文件夹中共找到 {len(fallback_docs)} 个doc_*.md文件")
     
     return True
 
 
-def test_basic_import():
+def test_basic_import(log=print):
     """测试基本导入"""
-    print("\n测试基本导入...")
+    log("\n测试基本导入...")
     
     try:
         from rag_demo import MedicalRAGSystem
-        print("  ✓ 成功导入MedicalRAGSystem")
+        log("  ✓ 成功导入MedicalRAGSystem")
         return True
     except Exception as e:
-        print(f"  ❌ 导入失败: {e}")
+        log(f"  ❌ 导入失败: {e}")
         return False
 
 
@@ -173,13 +183,31 @@ def main():
         ("数据目录", check_data_directory),
         ("基本导入", test_basic_import),
     ]
-    
-    results = []
-    for name, check_func in checks:
-        result = check_func()
-        results.append((name, result))
-        if not result:
-            print(f"\n⚠ {name}检查失败，请修复后继续")
+    # 相互独立的检查（导入依赖包、读 .env、遍历数据目录）放到线程池并行执行，
+    # 输出先写入各自的缓冲区，结束后按原顺序打印；基本导入依赖前面的检查，最后单独执行
+    parallel = {"依赖包", "环境变量", "数据目录"}
+
+    def run_buffered(check_func):
+        buffer = io.StringIO()
+        return check_func(log=partial(print, file=buffer)), buffer
+
+    with ThreadPoolExecutor(max_workers=len(parallel)) as executor:
+        futures = {
+            name: executor.submit(run_buffered, check_func)
+            for name, check_func in checks
+            if name in parallel
+        }
+
+        results = []
+        for name, check_func in checks:
+            if name in futures:
+                result, buffer = futures[name].result()
+                print(buffer.getvalue(), end="")
+            else:
+                result = check_func()
+            results.append((name, result))
+            if not result:
+                print(f"\n⚠ {name}检查失败，请修复后继续")
     
     print("\n" + "="*80)
     print("测试摘要")